@@ -25,6 +25,7 @@
           propagatedBuildInputs = [
             pythonPackages.neo4j
             pythonPackages.requests
+            pythonPackages.httpx
             pythonPackages.numpy
             pythonPackages.setuptools
             pythonPackages.mcp
@@ -51,6 +52,7 @@
             (python.withPackages (ps: with ps; [
               neo4j
               requests
+              httpx
               numpy
               setuptools
             ]))
@@ -1,12 +1,25 @@
 import os
 import uuid
 import json
+import socket
 import requests
 import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Iterator
 from datetime import datetime
 
+from .raiven_cache import EmbeddingCache, GenerationCounter, ResultCache
+from .raiven_schema import SchemaManager
+from .raiven_notify import notify_metabolism
+from .raiven_vector_index import LocalVectorIndex
+from .raiven_compact import FullVectorStore, compact_vector, rerank
+from .raiven_entities import EntityGazetteer, heuristic_entities
+from .raiven_graph import EntityGraph
+from . import raiven_dissonance as dissonance
+from . import raiven_raptor as raptor
+
 # --- Configuration Loader ---
 def get_config(key: str, default: Any = None) -> Any:
     return os.getenv(key, default)
@@ -38,48 +51,349 @@ CHAT_MODEL = get_config("RAIVEN_OLLAMA_CHAT_MODEL", "gemma:2b")
 SUBCONSCIOUS_MODEL = get_config("RAIVEN_OLLAMA_SUBCONSCIOUS_MODEL", "gemma:2b") # Reverted to gemma:2b for stability
 VECTOR_DIMENSIONS = int(get_config("RAIVEN_VECTOR_DIMENSIONS", "768"))
 
+# Connection pooling for the Bolt driver (one driver per CognitiveMemory)
+NEO4J_MAX_POOL_SIZE = int(get_config("RAIVEN_NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUISITION_TIMEOUT = float(get_config("RAIVEN_NEO4J_ACQUISITION_TIMEOUT", "60"))
+NEO4J_MAX_RETRY_TIME = float(get_config("RAIVEN_NEO4J_MAX_RETRY_TIME", "30"))
+# Keep-alive pool for the HTTP path (Neo4j REST API and Ollama)
+HTTP_POOL_CONNECTIONS = int(get_config("RAIVEN_HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(get_config("RAIVEN_HTTP_POOL_MAXSIZE", "16"))
+
+# Batch embedding: the metabolism adapts the batch size to keep each request near the target latency
+OLLAMA_EMBED_TIMEOUT = float(get_config("RAIVEN_OLLAMA_EMBED_TIMEOUT", "120"))
+EMBED_BATCH_MAX = int(get_config("RAIVEN_EMBED_BATCH_MAX", "64"))
+EMBED_TARGET_SECONDS = float(get_config("RAIVEN_EMBED_TARGET_SECONDS", "10"))
+
+# Content-addressed embedding cache (in-memory LRU in front of an optional SQLite file)
+EMBEDDING_CACHE_SIZE = int(get_config("RAIVEN_EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_CACHE_PATH = get_config("RAIVEN_EMBEDDING_CACHE_PATH", "~/.cache/raiven/embeddings.sqlite3")
+# Retrieval result cache, invalidated by the write generation stored in the same file
+RESULT_CACHE_SIZE = int(get_config("RAIVEN_RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(get_config("RAIVEN_RESULT_CACHE_TTL", "300"))
+
+# Session logging: recorded chat messages are buffered and written in batches this
+# often by the MCP server (0 writes every message immediately)
+SESSION_LOG_FLUSH_SECONDS = float(get_config("RAIVEN_SESSION_LOG_FLUSH_SECONDS", "1"))
+SESSION_LOG_BATCH = 100
+# Session log reading: messages per page, and per network fetch when streaming over Bolt
+SESSION_PAGE_SIZE = int(get_config("RAIVEN_SESSION_PAGE_SIZE", "200"))
+SESSION_STREAM_FETCH_SIZE = 500
+
+# Incremental graph pruning in the metabolism (entities visited per transaction)
+PRUNE_BATCH_SIZE = int(get_config("RAIVEN_PRUNE_BATCH_SIZE", "500"))
+
+# Edge decay: co-occurrence weights halve after this many days without reinforcement
+# (0 disables decay), and the metabolism sweeps the graph at least this often to apply it
+EDGE_HALF_LIFE_DAYS = float(get_config("RAIVEN_EDGE_HALF_LIFE_DAYS", "30"))
+EDGE_DECAY_INTERVAL_SECONDS = float(get_config("RAIVEN_EDGE_DECAY_INTERVAL_SECONDS", "3600"))
+
+# Metabolism pacing: share of wall time the worker may spend busy, load-average ceiling
+# per CPU (0 disables the check), and the longest it sleeps between idle checks
+METABOLISM_CPU_BUDGET = float(get_config("RAIVEN_METABOLISM_CPU_BUDGET", "1.0"))
+METABOLISM_MAX_LOAD = float(get_config("RAIVEN_METABOLISM_MAX_LOAD", "0"))
+METABOLISM_IDLE_SECONDS = float(get_config("RAIVEN_METABOLISM_IDLE_SECONDS", "60"))
+
+# Work claiming: metabolism workers lease chunks before processing them, so several
+# workers (threads, processes or hosts) can share the backlog without duplicating work
+WORKER_ID = get_config("RAIVEN_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+LEASE_SECONDS = int(get_config("RAIVEN_LEASE_SECONDS", "300"))
+METABOLISM_THREADS = int(get_config("RAIVEN_METABOLISM_THREADS", "1"))
+
+# Local wake-up channel: writers signal idle metabolism workers through Unix sockets in
+# this directory (empty disables it); the poll interval is the fallback for missed signals
+WAKEUP_DIR = get_config("RAIVEN_WAKEUP_DIR", "~/.cache/raiven/wakeup")
+METABOLISM_POLL_SECONDS = float(get_config("RAIVEN_METABOLISM_POLL_SECONDS", "300"))
+
+# Dissonance triage: only neighbours of the same topic that are not the same text reach
+# the LLM, up to DISSONANCE_PROMPT_ITEMS chunks per prompt; the upper cosine bound for
+# restatements is disabled at 1.0, as near-identical pairs are the likeliest contradictions
+DISSONANCE_MIN_SIMILARITY = float(get_config("RAIVEN_DISSONANCE_MIN_SIMILARITY", "0.6"))
+DISSONANCE_MAX_SIMILARITY = float(get_config("RAIVEN_DISSONANCE_MAX_SIMILARITY", "1.0"))
+DISSONANCE_PROMPT_ITEMS = max(1, int(get_config("RAIVEN_DISSONANCE_PROMPT_ITEMS", "4")))
+DISSONANCE_CLAIM_SIZE = 2 * DISSONANCE_PROMPT_ITEMS
+# Prompts a chunk may go unanswered in before it is marked checked without a verdict
+DISSONANCE_MAX_ATTEMPTS = 3
+
+# RAPTOR tree: nodes clustered per metabolism run, target children per summary, and the
+# fewest chunks worth a summary
+RAPTOR_BATCH_SIZE = int(get_config("RAIVEN_RAPTOR_BATCH_SIZE", "256"))
+RAPTOR_CLUSTER_SIZE = int(get_config("RAIVEN_RAPTOR_CLUSTER_SIZE", "8"))
+RAPTOR_MIN_CLUSTER = 3
+
+# Optional local mirror of the embeddings (memory-mapped matrix, empty path disables it)
+VECTOR_MIRROR_PATH = get_config("RAIVEN_VECTOR_MIRROR_PATH", "")
+VECTOR_MIRROR_DTYPE = get_config("RAIVEN_VECTOR_MIRROR_DTYPE", "float32")
+VECTOR_MIRROR_IVF_LISTS = int(get_config("RAIVEN_VECTOR_MIRROR_IVF_LISTS", "0"))
+VECTOR_MIRROR_SYNC_BATCH = 1000
+
+# Embedding storage layout. "compact" keeps a truncated, renormalised float32 vector on
+# the nodes (and quantized indexes where supported); the full vectors live in a local
+# side store and rerank an over-fetched candidate set. Switch with `raiven-compact migrate`.
+EMBEDDING_STORAGE = get_config("RAIVEN_EMBEDDING_STORAGE", "full")
+COMPACT_DIMENSIONS = int(get_config("RAIVEN_COMPACT_DIMENSIONS", "256"))
+COMPACT_RERANK_FACTOR = int(get_config("RAIVEN_COMPACT_RERANK_FACTOR", "4"))
+FULL_VECTOR_STORE_PATH = get_config("RAIVEN_FULL_VECTOR_STORE_PATH", "~/.cache/raiven/full_vectors.sqlite3")
+# Dimensions of the vectors stored on nodes and in the vector indexes
+INDEX_DIMENSIONS = COMPACT_DIMENSIONS if EMBEDDING_STORAGE == "compact" else VECTOR_DIMENSIONS
+
+# In-process entity gazetteer: reloaded from the graph at most this often, and only
+# after writes, to pick up other processes' entities (0 disables it)
+ENTITY_REFRESH_SECONDS = float(get_config("RAIVEN_ENTITY_REFRESH_SECONDS", "600"))
+ENTITY_LOAD_BATCH = 5000
+
+# In-process snapshot of the weighted entity graph for fast-mode recall: after writes,
+# edges changed since the last refresh are applied at most this often (0 disables the
+# snapshot), and it is rebuilt from scratch, dropping deleted edges, at the longer interval
+GRAPH_CACHE_REFRESH_SECONDS = float(get_config("RAIVEN_GRAPH_CACHE_REFRESH_SECONDS", "5"))
+GRAPH_CACHE_REBUILD_SECONDS = float(get_config("RAIVEN_GRAPH_CACHE_REBUILD_SECONDS", "3600"))
+# Graph relevance in retrieval: personalised PageRank vectors cached per seed set, related
+# entities kept, and chunks read per related entity
+PPR_CACHE_SIZE = int(get_config("RAIVEN_PPR_CACHE_SIZE", "256"))
+GRAPH_RELATED_ENTITIES = 10
+GRAPH_MENTIONS_PER_ENTITY = 20
+
+def embedding_assignment(node: str, value: str) -> str:
+    """
+    Cypher clause storing the vector `value` as the `embedding` of `node`.
+    """
+    if EMBEDDING_STORAGE == "compact":
+        # A float32 vector property takes half the space of a float list
+        return f"WITH * CALL db.create.setNodeVectorProperty({node}, 'embedding', {value})"
+    return f"SET {node}.embedding = {value}"
+
+def decayed_weight(rel: str) -> str:
+    """
+    Cypher expression for the current weight of the edge `rel`: its stored weight,
+    decayed exponentially since `decayed_at` (epoch milliseconds). Edges written
+    before decay existed start decaying at their first sweep.
+    """
+    if EDGE_HALF_LIFE_DAYS <= 0:
+        return f"{rel}.weight"
+    half_life_ms = EDGE_HALF_LIFE_DAYS * 86_400_000
+    return f"{rel}.weight * 2.0 ^ (toFloat(coalesce({rel}.decayed_at, timestamp()) - timestamp()) / {half_life_ms})"
+
+# --- Retrieval statements (shared by CognitiveMemory and AsyncCognitiveMemory) ---
+EPISODIC_SUBQUERY = """
+    CALL {
+        CALL db.index.vector.queryNodes('chunk_embeddings', $k, $vec)
+        YIELD node, score
+        RETURN collect({
+            id: node.id,
+            text: node.text,
+            score: score,
+            potential_dissonance: coalesce(node.potential_dissonance, false),
+            dissonance_report: node.dissonance_report
+        }) as episodic
+    }
+"""
+SUMMARY_SUBQUERY = """
+    CALL {
+        // Over-fetch: summaries awaiting a refresh after an edit are skipped
+        CALL db.index.vector.queryNodes('summary_embeddings', 4, $vec)
+        YIELD node, score
+        WITH node, score
+        WHERE coalesce(node.dirty, false) = false
+        RETURN collect(node.text)[..2] as summaries
+    }
+"""
+# Same results for ids ranked by the local vector mirror ($hits / $summary_hits: [{id, score}])
+MIRRORED_EPISODIC_SUBQUERY = """
+    CALL {
+        UNWIND $hits AS hit
+        MATCH (node:Chunk {id: hit.id})
+        WITH node, hit.score as score
+        ORDER BY score DESC
+        RETURN collect({
+            id: node.id,
+            text: node.text,
+            score: score,
+            potential_dissonance: coalesce(node.potential_dissonance, false),
+            dissonance_report: node.dissonance_report
+        })[..$k] as episodic
+    }
+"""
+MIRRORED_SUMMARY_SUBQUERY = """
+    CALL {
+        UNWIND $summary_hits AS hit
+        MATCH (node:Summary {id: hit.id})
+        WHERE coalesce(node.dirty, false) = false
+        WITH node, hit.score as score
+        ORDER BY score DESC
+        RETURN collect(node.text)[..2] as summaries
+    }
+"""
+GRAPH_FACTS_SUBQUERY = """
+    CALL {
+        MATCH (e:Entity)
+        WHERE e.name IN $keywords
+        MATCH (e)-[r:RELATED_TO]-(neighbor)
+        WITH e.name + ' is related to ' + neighbor.name as fact
+        LIMIT $fact_limit
+        RETURN collect(fact) as facts
+    }
+"""
+# Facts already computed from the in-process entity graph
+PROVIDED_FACTS_SUBQUERY = """
+    CALL {
+        RETURN $facts as facts
+    }
+"""
+# Chunks mentioning the entities related to the query, by summed relevance
+GRAPH_MEMORIES_SUBQUERY = f"""
+    CALL {{
+        UNWIND $related AS entity
+        CALL {{
+            WITH entity
+            MATCH (:Entity {{name: entity.name}})<-[:MENTIONS]-(c:Chunk)
+            RETURN c
+            LIMIT {GRAPH_MENTIONS_PER_ENTITY}
+        }}
+        WITH c, sum(entity.score) as score
+        ORDER BY score DESC
+        LIMIT $graph_k
+        RETURN collect({{id: c.id, text: c.text, score: score}}) as graph_hits
+    }}
+"""
+
+def neo4j_endpoint(database: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Returns the Neo4j URL (Bolt URI or REST transaction endpoint) and the HTTP headers.
+    """
+    # Check if URI is bolt or http
+    if NEO4J_URI.startswith("bolt"):
+         url = NEO4J_URI # Bolt uses its own protocol
+    else:
+         url = f"{NEO4J_URI.rstrip('/')}/db/{database}/tx/commit"
+        
+    headers = {
+        "Content-Type": "application/json",
+        "Accept": "application/json"
+    }
+    
+    # Database Auth via Basic Auth
+    if NEO4J_USER and NEO4J_PASSWORD:
+        auth_str = f"{NEO4J_USER}:{NEO4J_PASSWORD}"
+        encoded_auth = base64.b64encode(auth_str.encode()).decode()
+        headers["Authorization"] = f"Basic {encoded_auth}"
+    return url, headers
+
 class CognitiveMemory:
-    def __init__(self, database: str = None):
+    def __init__(self, database: str = None, worker_id: str = None):
         self.database = database or NEO4J_DATABASE or "neo4j"
-        # Check if URI is bolt or http
-        if NEO4J_URI.startswith("bolt"):
-             self.neo4j_url = NEO4J_URI # Bolt uses its own protocol
-        else:
-             self.neo4j_url = f"{NEO4J_URI.rstrip('/')}/db/{self.database}/tx/commit"
-            
-        self.neo4j_headers = {
-            "Content-Type": "application/json",
-            "Accept": "application/json"
-        }
+        # Owner recorded on leased chunks; metabolism threads pass their own ids
+        self.worker_id = worker_id or WORKER_ID
+        self.neo4j_url, self.neo4j_headers = neo4j_endpoint(self.database)
+
+        # The Bolt driver owns a connection pool, so it is created once and reused
+        # by every query instead of paying a TCP/TLS/auth handshake per statement.
+        self._driver = None
+        # The HTTP path (Neo4j REST and Ollama) shares one keep-alive session instead of
+        # opening a fresh connection per request.
+        self._http = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE,
+            # Only connection failures are retried: a POST that reached the server is never replayed
+            max_retries=Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.2),
+        )
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)
+        if self.neo4j_url.startswith("bolt"):
+            from neo4j import GraphDatabase
+            self._driver = GraphDatabase.driver(
+                self.neo4j_url,
+                auth=(NEO4J_USER, NEO4J_PASSWORD),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                max_transaction_retry_time=NEO4J_MAX_RETRY_TIME,
+                keep_alive=True,
+            )
+        
+        self.embedding_cache = EmbeddingCache(max_entries=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH)
+        # Writes bump the (cross-process) generation, which invalidates cached retrievals
+        self.result_cache = ResultCache(
+            GenerationCounter(path=EMBEDDING_CACHE_PATH),
+            max_entries=RESULT_CACHE_SIZE,
+            ttl_seconds=RESULT_CACHE_TTL,
+        )
         
-        # Database Auth via Basic Auth
-        if NEO4J_USER and NEO4J_PASSWORD:
-            auth_str = f"{NEO4J_USER}:{NEO4J_PASSWORD}"
-            encoded_auth = base64.b64encode(auth_str.encode()).decode()
-            self.neo4j_headers["Authorization"] = f"Basic {encoded_auth}"
+        self.full_vectors = FullVectorStore(FULL_VECTOR_STORE_PATH) if EMBEDDING_STORAGE == "compact" else None
+        self.vector_index = None
+        if VECTOR_MIRROR_PATH:
+            try:
+                self.vector_index = LocalVectorIndex(
+                    VECTOR_MIRROR_PATH, INDEX_DIMENSIONS,
+                    dtype=VECTOR_MIRROR_DTYPE, ivf_lists=VECTOR_MIRROR_IVF_LISTS,
+                )
+            except Exception as e:
+                import sys
+                print(f"Warning: Vector mirror at {VECTOR_MIRROR_PATH} unavailable, using Neo4j only: {e}", file=sys.stderr)
         
         self._initialize_schema()
 
+        # Loaded in the background; the heuristic is used until it is ready
+        self.entities = None
+        if ENTITY_REFRESH_SECONDS > 0:
+            self.entities = EntityGazetteer(
+                self._entity_names, ENTITY_REFRESH_SECONDS, generation=self.result_cache.generation.current,
+            )
+        # Loaded by the first fast-mode lookup
+        self.graph = None
+        if GRAPH_CACHE_REFRESH_SECONDS > 0:
+            self.graph = EntityGraph(
+                self._graph_edges, self._graph_edges_since, count_edges=self._graph_edge_count,
+                refresh_seconds=GRAPH_CACHE_REFRESH_SECONDS, rebuild_seconds=GRAPH_CACHE_REBUILD_SECONDS,
+                generation=self.result_cache.generation.current, ppr_cache_size=PPR_CACHE_SIZE,
+            )
+
     def close(self):
-        pass
+        """
+        Releases the pooled Neo4j and HTTP connections.
+        """
+        if self._driver is not None:
+            self._driver.close()
+            self._driver = None
+        self._http.close()
+        self.embedding_cache.close()
+        self.result_cache.generation.close()
+        if self.vector_index is not None:
+            self.vector_index.close()
+        if self.full_vectors is not None:
+            self.full_vectors.close()
+
+    def __enter__(self):
+        return self
 
-    def _query_neo4j(self, cypher: str, parameters: Dict[str, Any] = None) -> Dict[str, Any]:
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _run_transaction(tx, statements: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
         """
-        Executes a Cypher query via the Neo4j REST API or Bolt.
+        Transaction function for the Bolt driver. Results are fully consumed inside
+        the transaction so the driver can safely retry it on transient errors.
         """
-        if self.neo4j_url.startswith("bolt"):
-            from neo4j import GraphDatabase
-            # We use a context manager for the driver if we were in a long-lived app,
-            # but for simplicity in this REST-compatible structure, we create it.
-            # In a production environment with Bolt, using the official driver is better.
-            with GraphDatabase.driver(self.neo4j_url, auth=(NEO4J_USER, NEO4J_PASSWORD)) as driver:
-                with driver.session(database=self.database) as session:
-                    result = session.run(cypher, parameters or {})
-                    # Format to match the REST API response structure expected by other methods
-                    data = {"results": [{"columns": [], "data": []}], "errors": []}
-                    for record in result:
-                        data["results"][0]["data"].append({"row": list(record.values())})
-                    return data
+        # Format to match the REST API response structure expected by other methods
+        data = {"results": [], "errors": []}
+        for cypher, parameters in statements:
+            result = tx.run(cypher, parameters or {})
+            rows = [{"row": list(record.values())} for record in result]
+            data["results"].append({"columns": list(result.keys()), "data": rows})
+        return data
+
+    def _query_neo4j_batch(self, statements: List[Tuple[str, Dict[str, Any]]], read_only: bool = False) -> Dict[str, Any]:
+        """
+        Executes several Cypher statements in a single transaction and a single round trip.
+        Returns the REST-style response with one entry in "results" per statement, in order.
+        """
+        if not statements:
+            return {"results": [], "errors": []}
+
+        if self._driver is not None:
+            with self._driver.session(database=self.database) as session:
+                if read_only:
+                    return session.execute_read(self._run_transaction, statements)
+                return session.execute_write(self._run_transaction, statements)
 
         payload = {
             "statements": [
@@ -87,9 +401,10 @@ class CognitiveMemory:
                     "statement": cypher,
                     "parameters": parameters or {}
                 }
+                for cypher, parameters in statements
             ]
         }
-        response = requests.post(self.neo4j_url, json=payload, headers=self.neo4j_headers)
+        response = self._http.post(self.neo4j_url, json=payload, headers=self.neo4j_headers)
         response.raise_for_status()
         
         data = response.json()
@@ -97,58 +412,110 @@ class CognitiveMemory:
             raise Exception(f"Neo4j Error: {data['errors']}")
         return data
 
+    def _query_neo4j(self, cypher: str, parameters: Dict[str, Any] = None, read_only: bool = False,
+                     managed: bool = True) -> Dict[str, Any]:
+        """
+        Executes a Cypher query via the Neo4j REST API or Bolt.
+        On Bolt, the query runs as a managed read or write transaction on a pooled
+        connection and is retried by the driver on transient failures. Queries that
+        are not safe to replay, or need an auto-commit transaction (`CALL { ... } IN
+        TRANSACTIONS`), such as raw user Cypher, pass `managed=False` and run once.
+        """
+        if self._driver is not None and not managed:
+            with self._driver.session(database=self.database) as session:
+                # An auto-commit session.run reads like a transaction's run
+                return self._run_transaction(session, [(cypher, parameters)])
+        return self._query_neo4j_batch([(cypher, parameters)], read_only=read_only)
+
+    def _mirror(self, operation: str, *args):
+        """
+        Applies a write to the local vector mirror, if any. The mirror is a cache of
+        Neo4j: a failure here is logged and repaired by the metabolism's resync.
+        """
+        if self.vector_index is None:
+            return
+        try:
+            getattr(self.vector_index, operation)(*args)
+        except Exception as e:
+            import sys
+            print(f"Warning: Vector mirror {operation} failed: {e}", file=sys.stderr)
+
+    def _storage_vector(self, vector: List[float]) -> List[float]:
+        """
+        The form of an embedding that is stored on nodes and searched in the indexes.
+        """
+        if self.full_vectors is None:
+            return vector
+        return compact_vector(vector, COMPACT_DIMENSIONS)
+
+    def _keep_full(self, operation: str, *args):
+        """
+        Applies a write to the full-precision side store in compact mode. Losing a
+        vector there only costs rerank precision, so failures are logged.
+        """
+        if self.full_vectors is None:
+            return
+        try:
+            getattr(self.full_vectors, operation)(*args)
+        except Exception as e:
+            import sys
+            print(f"Warning: Full vector store {operation} failed: {e}", file=sys.stderr)
+
     def _initialize_schema(self):
         # We use a try-except block and print to stderr to avoid polluting stdout for MCP
         try:
             # First, check if database exists and is online
             try:
-                self._query_neo4j("RETURN 1")
+                self._query_neo4j("RETURN 1", read_only=True)
             except Exception as e:
                 import sys
                 print(f"Warning: Database '{self.database}' not ready or accessible: {e}", file=sys.stderr)
                 return
 
-            self._query_neo4j(f"""
-                CREATE VECTOR INDEX chunk_embeddings IF NOT EXISTS
-                FOR (c:Chunk) ON (c.embedding)
-                OPTIONS {{indexConfig: {{
-                 `vector.dimensions`: {VECTOR_DIMENSIONS},
-                 `vector.similarity_function`: 'cosine'
-                }}}}
-            """)
-            
-            self._query_neo4j(f"""
-                CREATE VECTOR INDEX summary_embeddings IF NOT EXISTS
-                FOR (s:Summary) ON (s.embedding)
-                OPTIONS {{indexConfig: {{
-                 `vector.dimensions`: {VECTOR_DIMENSIONS},
-                 `vector.similarity_function`: 'cosine'
-                }}}}
-            """)
-
-            self._query_neo4j("""
-                CREATE CONSTRAINT entity_id IF NOT EXISTS 
-                FOR (e:Entity) REQUIRE e.name IS UNIQUE
-            """)
+            version = SchemaManager(self._query_neo4j, INDEX_DIMENSIONS).migrate()
             import sys
-            print(f">> Schema & Indexes Initialized (Dimensions: {VECTOR_DIMENSIONS}) for database: {self.database}", file=sys.stderr)
+            print(f">> Schema & Indexes Initialized (Version: {version}, Dimensions: {INDEX_DIMENSIONS}, Storage: {EMBEDDING_STORAGE}) for database: {self.database}", file=sys.stderr)
         except Exception as e:
             import sys
             print(f"Error initializing schema: {e}", file=sys.stderr)
 
     def _embed(self, text: str) -> List[float]:
-        url = f"{OLLAMA_HOST.rstrip('/')}/api/embeddings"
+        return self._embed_batch([text])[0]
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many inputs, returning one vector per input, in order.
+        Inputs already in the embedding cache are served from it; the rest are sent
+        to Ollama in a single request.
+        """
+        vectors = [self.embedding_cache.get(EMBEDDING_MODEL, text) for text in texts]
+        missing = list(dict.fromkeys(text for text, vec in zip(texts, vectors) if vec is None))
+        if missing:
+            fetched = dict(zip(missing, self._request_embeddings(missing)))
+            for text, vec in fetched.items():
+                self.embedding_cache.put(EMBEDDING_MODEL, text, vec)
+            vectors = [vec if vec is not None else fetched[text] for text, vec in zip(texts, vectors)]
+        return vectors
+
+    def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds many inputs with a single request to Ollama's batch /api/embed endpoint.
+        """
+        url = f"{OLLAMA_HOST.rstrip('/')}/api/embed"
         headers = {"X-Api-Key": OLLAMA_API_KEY} if OLLAMA_API_KEY else {}
         payload = {
             "model": EMBEDDING_MODEL,
-            "prompt": text
+            "input": texts
         }
 
         try:
-            # Increased timeout for embedding to handle slower models
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            # Increased timeout for embedding to handle slower models and large batches
+            response = self._http.post(url, json=payload, headers=headers, timeout=OLLAMA_EMBED_TIMEOUT)
             response.raise_for_status()
-            return response.json()["embedding"]
+            embeddings = response.json()["embeddings"]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+            return embeddings
         except Exception as e:
             # We log to stderr and re-raise
             import sys
@@ -169,312 +536,1205 @@ class CognitiveMemory:
         }
         
         try:
-            response = requests.post(url, json=payload, headers=headers)
+            response = self._http.post(url, json=payload, headers=headers)
             response.raise_for_status()
             return response.json()["response"]
         except Exception as e:
             print(f"Error calling Ollama Chat ({target_model}): {e}")
             return ""
 
-    def add_memory(self, text: str, role: str = "user", entities: List[str] = None):
-        chunk_id = str(uuid.uuid4())
-        
-        # --- Entity Extraction Strategy ---
-        if entities:
-            extracted_entities = entities
-        else:
-            extracted_entities = [word.strip(".,!?") for word in text.split() if word[0].isupper() and len(word) > 1] 
+    @staticmethod
+    def _extract_entities(text: str, gazetteer: EntityGazetteer = None) -> List[str]:
+        """
+        Entities of a new memory: the known entity names it mentions (gazetteer) plus
+        capitalised words, stripped of trailing punctuation, for new ones.
+        """
+        if gazetteer is not None and gazetteer.ready:
+            return gazetteer.extract(text)
+        return heuristic_entities(text)
+
+    @staticmethod
+    def _query_entities(query: str, gazetteer: EntityGazetteer = None) -> List[str]:
+        """
+        Entity names to look up for a query. With the gazetteer only names that exist
+        in the graph are sent; without it, the capitalised words.
+        """
+        if gazetteer is not None and gazetteer.ready:
+            return gazetteer.known(query)
+        return heuristic_entities(query)
+
+    def _entity_names(self):
+        """
+        Every Entity name, paged through the name constraint index (gazetteer loader).
+        """
+        cursor = ""
+        while True:
+            res = self._query_neo4j("""
+                MATCH (e:Entity)
+                WHERE e.name > $cursor
+                RETURN e.name
+                ORDER BY e.name
+                LIMIT $batch
+            """, {"cursor": cursor, "batch": ENTITY_LOAD_BATCH}, read_only=True)
+            names = [r["row"][0] for r in res["results"][0]["data"]]
+            yield from names
+            if len(names) < ENTITY_LOAD_BATCH:
+                return
+            cursor = names[-1]
 
-        # We store the chunk WITHOUT embedding first to make the call near-instant
-        query_chunk = """
+    def _graph_edges(self):
+        """
+        Every RELATED_TO edge as (source, target, weight, updated_at), paged by
+        source entity (graph snapshot loader).
+        """
+        cursor = ""
+        while True:
+            res = self._query_neo4j("""
+                MATCH (e:Entity)
+                WHERE e.name > $cursor
+                WITH e ORDER BY e.name LIMIT $batch
+                RETURN e.name, [(e)-[r:RELATED_TO]->(t:Entity) | [t.name, r.weight, coalesce(r.updated_at, 0)]]
+            """, {"cursor": cursor, "batch": ENTITY_LOAD_BATCH}, read_only=True)
+            rows = [r["row"] for r in res["results"][0]["data"]]
+            for name, edges in rows:
+                for target, weight, updated_at in edges:
+                    yield name, target, weight, updated_at
+            if len(rows) < ENTITY_LOAD_BATCH:
+                return
+            cursor = rows[-1][0]
+
+    def _graph_edges_since(self, since: int):
+        """
+        RELATED_TO edges written after `since` (epoch milliseconds): the change feed
+        of the graph snapshot, served by the updated_at index.
+        """
+        res = self._query_neo4j("""
+            MATCH (a:Entity)-[r:RELATED_TO]->(b:Entity)
+            WHERE r.updated_at > $since
+            RETURN a.name, b.name, r.weight, r.updated_at
+        """, {"since": since}, read_only=True)
+        return [tuple(r["row"]) for r in res["results"][0]["data"]]
+
+    def _graph_edge_count(self) -> int:
+        """
+        Number of RELATED_TO edges, read from the count store: the graph snapshot
+        compares it with its own to notice deleted edges the change feed cannot show.
+        """
+        res = self._query_neo4j("MATCH ()-[r:RELATED_TO]->() RETURN count(r)", read_only=True)
+        return res["results"][0]["data"][0]["row"][0]
+
+    @classmethod
+    def _build_ingest_statements(cls, items: List[Dict[str, Any]], prune_threshold: float = None,
+                                 gazetteer: EntityGazetteer = None) -> Tuple[List[str], List[Tuple[str, Dict[str, Any]]]]:
+        """
+        Builds the statements that write a batch of memories in one transaction.
+        Each item is a dict with "text" and optional "role" and "entities".
+        With a prune_threshold, weak edges are pruned around the batch's entities only.
+        Returns the generated chunk ids (in item order) and the statements.
+        """
+        chunks = []
+        # Co-occurrence counts are aggregated client side, so every entity pair gets
+        # exactly one MERGE per batch and is bumped once per chunk it co-occurs in.
+        pair_counts: Dict[Tuple[str, str], int] = {}
+        for item in items:
+            text = item["text"]
+            names = item.get("entities") or cls._extract_entities(text, gazetteer)
+            # Deduplicate while preserving order
+            names = [n for n in dict.fromkeys(names) if n]
+            chunks.append({
+                "id": str(uuid.uuid4()),
+                "text": text,
+                "role": item.get("role") or "user",
+                "entities": names,
+            })
+            for source in names:
+                for target in names:
+                    if source != target:
+                        pair_counts[(source, target)] = pair_counts.get((source, target), 0) + 1
+
+        # We store the chunks WITHOUT embedding first to make the call near-instant
+        query_chunks = """
+        UNWIND $chunks AS chunk
         CREATE (c:Chunk {
-            id: $id, 
-            text: $text, 
-            role: $role, 
+            id: chunk.id, 
+            text: chunk.text, 
+            role: chunk.role, 
             timestamp: datetime(),
-            needs_embedding: true
+            needs_embedding: true,
+            dissonance_checked: false
         })
+        WITH c, chunk
+        UNWIND chunk.entities AS name
+        MERGE (e:Entity {name: name})
+        MERGE (c)-[:MENTIONS]->(e)
+        """
+        # The first co-occurrence creates the edge at 2.0, every further one adds 1.0 to
+        # the decayed weight and restarts the decay clock
+        query_pairs = f"""
+        UNWIND $pairs AS pair
+        MATCH (e1:Entity {{name: pair.source}})
+        MATCH (e2:Entity {{name: pair.target}})
+        MERGE (e1)-[r:RELATED_TO]->(e2)
+        ON CREATE SET r.weight = 1.0 + pair.count
+        ON MATCH SET r.weight = {decayed_weight("r")} + pair.count
+        SET r.last_reinforced = timestamp(), r.decayed_at = timestamp(), r.updated_at = timestamp()
         """
-        self._query_neo4j(query_chunk, {"id": chunk_id, "text": text, "role": role})
-
-        for entity_name in extracted_entities:
-            query_entity = """
-            MATCH (c:Chunk {id: $chunk_id})
-            MERGE (e:Entity {name: $entity})
-            MERGE (c)-[:MENTIONS]->(e)
-            """
-            self._query_neo4j(query_entity, {"chunk_id": chunk_id, "entity": entity_name})
-            
-            query_rel = """
-            MATCH (c:Chunk {id: $chunk_id})-[:MENTIONS]->(e1:Entity)
-            MATCH (c)-[:MENTIONS]->(e2:Entity)
-            WHERE e1 <> e2
-            MERGE (e1)-[r:RELATED_TO]->(e2)
-            ON CREATE SET r.weight = 2.0
-            ON MATCH SET r.weight = r.weight + 1.0
-            """
-            self._query_neo4j(query_rel, {"chunk_id": chunk_id})
-
-        self.prune_weak_connections(threshold=0.5)
+        pairs = [{"source": s, "target": t, "count": n} for (s, t), n in pair_counts.items()]
 
-    def log_session_message(self, session_id: str, session_name: str, text: str, role: str):
+        statements = [(query_chunks, {"chunks": chunks})]
+        if pairs:
+            statements.append((query_pairs, {"pairs": pairs}))
+        if prune_threshold is not None:
+            touched = list(dict.fromkeys(name for c in chunks for name in c["entities"]))
+            if touched:
+                statements.extend(cls._prune_statements(prune_threshold, entities=touched))
+        return [c["id"] for c in chunks], statements
+
+    def add_memories(self, items: List[Dict[str, Any]], prune_threshold: float = None) -> List[str]:
         """
-        Records a message into a specific session log, isolated from main knowledge.
+        Bulk ingestion: writes the chunks, their entity mentions and the co-occurrence
+        edges of a whole batch in one UNWIND-based transaction (one round trip).
+        Each item is a dict with "text" and optional "role" and "entities".
+        With a prune_threshold, weak edges around the touched entities are pruned in the
+        same transaction; graph-wide pruning is left to the metabolism.
+        Returns the ids of the created chunks, in item order.
         """
-        message_id = str(uuid.uuid4())
-        cypher = """
-        MERGE (s:Session {id: $sid})
-        ON CREATE SET s.name = $sname, s.started_at = datetime()
-        
-        CREATE (m:MessageLog {
-            id: $mid,
-            text: $text,
-            role: $role,
-            timestamp: datetime()
-        })
-        
-        MERGE (s)-[:HAS_MESSAGE]->(m)
-        
-        WITH s, m
-        MATCH (s)-[:HAS_MESSAGE]->(prev:MessageLog)
-        WHERE prev <> m
-        WITH m, prev
-        ORDER BY prev.timestamp DESC
-        LIMIT 1
-        MERGE (prev)-[:NEXT_MESSAGE]->(m)
-        """
-        self._query_neo4j(cypher, {
+        if not items:
+            return []
+        chunk_ids, statements = self._build_ingest_statements(items, prune_threshold=prune_threshold, gazetteer=self.entities)
+        self._query_neo4j_batch(statements)
+        if self.entities is not None:
+            # The merged names are matched from now on
+            self.entities.add(name for chunk in statements[0][1]["chunks"] for name in chunk["entities"])
+        self.result_cache.generation.bump()
+        # New chunks need embeddings: wake the metabolism instead of waiting for its next poll
+        notify_metabolism(WAKEUP_DIR)
+        return chunk_ids
+
+    def add_memory(self, text: str, role: str = "user", entities: List[str] = None) -> str:
+        # Scoped prune: the cost is O(entities in the chunk), not O(graph)
+        return self.add_memories([{"text": text, "role": role, "entities": entities}], prune_threshold=0.5)[0]
+
+    def log_session_messages(self, session_id: str, session_name: str, messages: List[Dict[str, Any]]):
+        """
+        Appends messages (dicts with "text", "role" and an optional ISO "timestamp")
+        to a session log, isolated from main knowledge, in one transaction.
+        The Session keeps a message counter (seq) and a LAST_MESSAGE pointer to its
+        tail, so an append costs O(messages) whatever the session length.
+        """
+        if not messages:
+            return
+        rows = [{
+            "id": str(uuid.uuid4()),
+            "text": m["text"],
+            "role": m["role"],
+            "timestamp": m.get("timestamp"),
+        } for m in messages]
+        params = {
             "sid": session_id,
             "sname": session_name,
-            "mid": message_id,
-            "text": text,
-            "role": role
-        })
+            "messages": rows,
+            "chain": [{"prev": a["id"], "next": b["id"]} for a, b in zip(rows, rows[1:])],
+            "first": rows[0]["id"],
+            "last": rows[-1]["id"],
+        }
+        self._query_neo4j_batch([
+            # Reserving the sequence numbers write-locks the Session, so concurrent
+            # appends to it are serialised until this transaction commits
+            ("""
+                MERGE (s:Session {id: $sid})
+                ON CREATE SET s.name = $sname, s.started_at = datetime()
+                SET s.seq = coalesce(s.seq, 0) + size($messages)
+            """, params),
+            ("""
+                MATCH (s:Session {id: $sid})
+                UNWIND range(0, size($messages) - 1) AS i
+                WITH s, i, $messages[i] AS msg
+                CREATE (m:MessageLog {
+                    id: msg.id,
+                    text: msg.text,
+                    role: msg.role,
+                    timestamp: coalesce(datetime(msg.timestamp), datetime()),
+                    session_id: s.id,
+                    seq: s.seq - size($messages) + i + 1
+                })
+                CREATE (s)-[:HAS_MESSAGE]->(m)
+            """, params),
+            ("""
+                UNWIND $chain AS link
+                MATCH (a:MessageLog {id: link.prev})
+                MATCH (b:MessageLog {id: link.next})
+                CREATE (a)-[:NEXT_MESSAGE]->(b)
+            """, params),
+            # Splice the batch after the old tail and move the pointer
+            ("""
+                MATCH (s:Session {id: $sid})
+                MATCH (first:MessageLog {id: $first})
+                MATCH (newest:MessageLog {id: $last})
+                OPTIONAL MATCH (s)-[pointer:LAST_MESSAGE]->(tail:MessageLog)
+                DELETE pointer
+                CREATE (s)-[:LAST_MESSAGE]->(newest)
+                FOREACH (t IN CASE WHEN tail IS NULL THEN [] ELSE [tail] END |
+                    CREATE (t)-[:NEXT_MESSAGE]->(first)
+                )
+            """, params),
+        ])
+
+    def log_session_message(self, session_id: str, session_name: str, text: str, role: str):
+        """
+        Records a message into a specific session log, isolated from main knowledge.
+        """
+        self.log_session_messages(session_id, session_name, [{"text": text, "role": role}])
+
+    @staticmethod
+    def _session_page_statement(session_id: str, cursor: int = None, limit: int = SESSION_PAGE_SIZE,
+                                since: str = None, until: str = None, tail: bool = False) -> Tuple[str, Dict[str, Any]]:
+        """
+        Statement reading one page of a session log through the (session_id, seq)
+        index: the messages after `cursor` (a sequence number) or, with `tail`, the
+        last ones before it. `since`/`until` (ISO datetimes) restrict the time window.
+        Rows are (seq, role, text, timestamp).
+        """
+        if tail:
+            position, order = "($cursor IS NULL OR m.seq < $cursor)", "DESC"
+        else:
+            position, order = "m.seq > coalesce($cursor, 0)", "ASC"
+        cypher = f"""
+            MATCH (m:MessageLog)
+            WHERE m.session_id = $sid AND {position}
+              AND ($since IS NULL OR m.timestamp >= datetime($since))
+              AND ($until IS NULL OR m.timestamp < datetime($until))
+            RETURN m.seq, m.role, m.text, toString(m.timestamp)
+            ORDER BY m.seq {order}
+        """
+        params = {"sid": session_id, "cursor": cursor, "since": since, "until": until}
+        if limit is not None:
+            cypher += "LIMIT $limit"
+            params["limit"] = limit
+        return cypher, params
+
+    @staticmethod
+    def _session_page(rows: List[List[Any]], limit: int, tail: bool = False) -> Dict[str, Any]:
+        """
+        {"messages": [{seq, role, text, timestamp}] in chronological order, "next_cursor"}.
+        The cursor continues in the same direction and is None on the last page.
+        """
+        messages = [{"seq": seq, "role": role, "text": text, "timestamp": timestamp} for seq, role, text, timestamp in rows]
+        if tail:
+            messages.reverse()
+        next_cursor = None
+        if messages and len(messages) == limit:
+            next_cursor = messages[0]["seq"] if tail else messages[-1]["seq"]
+        return {"messages": messages, "next_cursor": next_cursor}
+
+    def get_session_messages(self, session_id: str, cursor: int = None, limit: int = SESSION_PAGE_SIZE,
+                             since: str = None, until: str = None, tail: bool = False) -> Dict[str, Any]:
+        """
+        One page of a session log, see _session_page_statement. Pass the returned
+        next_cursor back (with the same filters) to read the following page.
+        """
+        cypher, params = self._session_page_statement(session_id, cursor, limit, since, until, tail)
+        res = self._query_neo4j(cypher, params, read_only=True)
+        return self._session_page([r["row"] for r in res["results"][0]["data"]], limit, tail)
+
+    def iter_session_messages(self, session_id: str, since: str = None, until: str = None) -> Iterator[Dict[str, Any]]:
+        """
+        Yields the messages of a session in order, in constant memory. Over Bolt the
+        records are streamed from a single result, fetched SESSION_STREAM_FETCH_SIZE at
+        a time as the caller consumes them; over REST the log is read page by page.
+        """
+        if self._driver is not None:
+            from neo4j import READ_ACCESS
+            cypher, params = self._session_page_statement(session_id, limit=None, since=since, until=until)
+            # A single streamed result cannot be retried by the driver, unlike the
+            # transaction functions used elsewhere
+            with self._driver.session(database=self.database, default_access_mode=READ_ACCESS,
+                                      fetch_size=SESSION_STREAM_FETCH_SIZE) as session:
+                for record in session.run(cypher, params):
+                    seq, role, text, timestamp = record.values()
+                    yield {"seq": seq, "role": role, "text": text, "timestamp": timestamp}
+            return
+
+        cursor = None
+        while True:
+            page = self.get_session_messages(session_id, cursor=cursor, since=since, until=until)
+            yield from page["messages"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return
 
     def trigger_consolidation(self):
         """
         Manually triggers embedding generation for pending chunks,
         checks for cognitive dissonance, and updates RAPTOR summarization.
+        A failing step does not stop the later ones; the first error is raised
+        once all of them have run.
         """
-        self._process_pending_embeddings()
-        self._resolve_cognitive_dissonance()
-        self._update_raptor_tree()
+        import sys
+        errors = []
+        for step in (self._process_pending_embeddings, self._resolve_cognitive_dissonance,
+                     self._refresh_dirty_summaries, self._update_raptor_tree):
+            try:
+                step()
+            except Exception as e:
+                print(f"Warning: Consolidation step {step.__name__} failed: {e}", file=sys.stderr)
+                errors.append(e)
+        if errors:
+            raise errors[0]
 
-    def _resolve_cognitive_dissonance(self):
+    def _claim_nodes(self, label: str, condition: str, limit: int, worker_id: str = None,
+                     parameters: Dict[str, Any] = None, with_embedding: bool = False) -> List[Dict[str, Any]]:
         """
-        Analyzes recent chunks for potential contradictions with existing knowledge
-        using the internal LLM.
+        Atomically leases up to `limit` nodes of `label` matching `condition` (a Cypher
+        predicate on `c`) to a worker for LEASE_SECONDS and returns them oldest first.
+        Nodes leased by another worker are skipped until their lease expires, so a
+        crashed worker only delays its claims instead of losing them.
+        """
+        worker = worker_id or self.worker_id
+        result = self._query_neo4j(f"""
+            MATCH (c:{label})
+            WHERE {condition} AND coalesce(c.lease_expires < datetime(), true)
+            WITH c ORDER BY c.timestamp ASC LIMIT $limit
+            // Take the write lock, then re-check: a concurrent claimer may have won the race
+            SET c._lock = true
+            WITH c, ({condition} AND coalesce(c.lease_expires < datetime(), true)) as free
+            REMOVE c._lock
+            WITH c WHERE free
+            SET c.lease_owner = $worker,
+                c.lease_expires = datetime() + duration({{seconds: $lease}})
+            RETURN c.id as id, c.text as text, coalesce(c.failed_attempts, 0) as failed,
+                   {"c.embedding" if with_embedding else "null"} as embedding
+        """, {**(parameters or {}), "limit": limit, "worker": worker, "lease": LEASE_SECONDS})
+        return [dict(zip(("id", "text", "failed", "embedding"), r["row"])) for r in result["results"][0]["data"]]
+
+    def _claim_chunks(self, condition: str, limit: int, worker_id: str = None) -> List[Dict[str, Any]]:
+        return self._claim_nodes("Chunk", condition, limit, worker_id)
+
+    def _release_nodes(self, label: str, node_ids: List[str], worker_id: str = None, renew: bool = False):
+        """
+        Gives back leases that were claimed but not completed, or with `renew` extends
+        them for another LEASE_SECONDS during long-running work.
+        """
+        if not node_ids:
+            return
+        update = (
+            "SET c.lease_expires = datetime() + duration({seconds: $lease})" if renew
+            else "SET c.lease_owner = null, c.lease_expires = null"
+        )
+        self._query_neo4j(f"""
+            UNWIND $ids AS cid
+            MATCH (c:{label} {{id: cid}})
+            WHERE c.lease_owner = $worker
+            {update}
+        """, {"ids": node_ids, "worker": worker_id or self.worker_id, "lease": LEASE_SECONDS})
+
+    def _release_chunks(self, chunk_ids: List[str], worker_id: str = None):
+        self._release_nodes("Chunk", chunk_ids, worker_id)
+
+    def _chunk_neighbours(self, chunk_ids: List[str], k: int = 2) -> Dict[str, Dict[str, Any]]:
+        """
+        Nearest chunks of already-embedded chunks, found with their stored vectors in
+        one round trip (no embedding call). A chunk never matches itself.
+        Returns {chunk_id: {embedding, entities, neighbours: [{id, text, score,
+        embedding, entities}, ...]}} best first; chunks without an embedding have no entry.
         """
-        # Find chunks that haven't been checked for dissonance yet
+        if not chunk_ids:
+            return {}
         result = self._query_neo4j("""
-            MATCH (c:Chunk)
-            WHERE c.dissonance_checked IS NULL AND NOT c.needs_embedding
-            RETURN c.id as id, c.text as text
-            LIMIT 5
-        """)
-        
-        rows = result["results"][0]["data"]
-        for r in rows:
-            cid, text = r["row"][0], r["row"][1]
-            
-            # Find potentially related information in the graph
-            context = self.retrieve(text, top_k=2)
-            existing_knowledge = "\n".join(context["episodic_hits"])
-            
-            if not existing_knowledge:
-                self._query_neo4j("MATCH (c:Chunk {id: $id}) SET c.dissonance_checked = true", {"id": cid})
-                continue
-
-            prompt = f"""
-            Analyze the following NEW information against the EXISTING knowledge.
-            Identify if there are direct contradictions or significant inconsistencies.
-            
-            EXISTING KNOWLEDGE:
-            {existing_knowledge}
-            
-            NEW INFORMATION:
-            {text}
-            
-            If there is a contradiction, explain it briefly. If they are consistent, reply 'CONSISTENT'.
-            """
-            
-            analysis = self._chat(prompt, model=SUBCONSCIOUS_MODEL)
-            
-            if "CONSISTENT" not in analysis.upper():
-                # Mark potential dissonance without automatically weakening connections.
-                # It is Malik's (active consciousness) responsibility to review these.
-                import sys
-                print(f">> Potential Cognitive Dissonance flagged in {cid} using {SUBCONSCIOUS_MODEL}", file=sys.stderr)
-                self._query_neo4j("""
-                    MATCH (c:Chunk {id: $id})
+            UNWIND $ids AS cid
+            MATCH (c:Chunk {id: cid})
+            WHERE c.embedding IS NOT NULL
+            CALL {
+                WITH c
+                // One extra candidate because the chunk itself is the closest match
+                CALL db.index.vector.queryNodes('chunk_embeddings', $k + 1, c.embedding)
+                YIELD node, score
+                WITH node, score
+                WHERE node <> c
+                RETURN collect({
+                    id: node.id,
+                    text: node.text,
+                    score: score,
+                    embedding: node.embedding,
+                    entities: [(node)-[:MENTIONS]->(e:Entity) | e.name]
+                })[..$k] as neighbours
+            }
+            RETURN cid, c.embedding, [(c)-[:MENTIONS]->(e:Entity) | e.name], neighbours
+        """, {"ids": chunk_ids, "k": k}, read_only=True)
+        return {
+            r["row"][0]: {"embedding": r["row"][1], "entities": r["row"][2], "neighbours": r["row"][3]}
+            for r in result["results"][0]["data"]
+        }
+
+    def _resolve_cognitive_dissonance(self, worker_id: str = None) -> int:
+        """
+        Analyzes recent chunks for potential contradictions with existing knowledge
+        using the internal LLM. Returns the number of chunks checked, and raises when
+        none could be, so the caller backs off.
+
+        Neighbours are triaged first (similarity band and shared entities), so only
+        same-topic pairs reach the LLM, several per prompt. Skipped chunks record
+        why in `dissonance_skip_reason`; items the model leaves unanswered are
+        released and checked again later, up to DISSONANCE_MAX_ATTEMPTS times.
+        """
+        import sys
+        worker = worker_id or self.worker_id
+        # Claim chunks that haven't been checked for dissonance yet
+        rows = self._claim_chunks("c.dissonance_checked = false AND c.needs_embedding = false", DISSONANCE_CLAIM_SIZE, worker)
+        pending = [r["id"] for r in rows]
+        try:
+            # Related knowledge comes from the stored vectors, not from a fresh retrieval
+            neighbours = self._chunk_neighbours(pending, k=2)
+            if self.full_vectors is not None:
+                # Triage thresholds are calibrated on full-precision similarities
+                full = self.full_vectors.get_many(
+                    list(neighbours) + [n["id"] for context in neighbours.values() for n in context["neighbours"]]
+                )
+                for cid, context in neighbours.items():
+                    for node in [context] + context["neighbours"]:
+                        node_id = node.get("id", cid)
+                        if node_id in full:
+                            node["embedding"] = full[node_id]
+
+            skipped, items = [], []
+            for r in rows:
+                context = neighbours.get(r["id"])
+                if context is None:
+                    # Gave up embedding: nothing to compare against
+                    skipped.append({"id": r["id"], "reason": dissonance.SKIP_NO_NEIGHBOURS})
+                    continue
+                candidates, reason = dissonance.triage(
+                    r["text"], context["embedding"], context["entities"], context["neighbours"],
+                    DISSONANCE_MIN_SIMILARITY, DISSONANCE_MAX_SIMILARITY,
+                )
+                if reason:
+                    skipped.append({"id": r["id"], "reason": reason})
+                else:
+                    items.append((r["id"], "\n".join(n["text"] for n in candidates), r["text"]))
+
+            consistent, flagged, unanswered = [], [], []
+            for start in range(0, len(items), DISSONANCE_PROMPT_ITEMS):
+                group = items[start:start + DISSONANCE_PROMPT_ITEMS]
+                prompt = dissonance.build_prompt([(existing, text) for _, existing, text in group])
+                verdicts = dissonance.parse_verdicts(self._chat(prompt, model=SUBCONSCIOUS_MODEL), len(group))
+                unanswered.extend(cid for index, (cid, _, _) in enumerate(group) if index not in verdicts)
+                for index, report in verdicts.items():
+                    cid = group[index][0]
+                    if report is None:
+                        consistent.append({"id": cid, "reason": None})
+                    else:
+                        # Mark potential dissonance without automatically weakening connections.
+                        # It is Malik's (active consciousness) responsibility to review these.
+                        print(f">> Potential Cognitive Dissonance flagged in {cid} using {SUBCONSCIOUS_MODEL}", file=sys.stderr)
+                        flagged.append({"id": cid, "report": report})
+
+            # Results are only written while the lease is still ours
+            statements = []
+            if skipped or consistent:
+                statements.append(("""
+                    UNWIND $rows AS row
+                    MATCH (c:Chunk {id: row.id})
+                    WHERE c.lease_owner = $worker
+                    SET c.dissonance_checked = true,
+                        c.dissonance_skip_reason = row.reason,
+                        c.lease_owner = null,
+                        c.lease_expires = null
+                """, {"rows": skipped + consistent, "worker": worker}))
+            if flagged:
+                statements.append(("""
+                    UNWIND $rows AS row
+                    MATCH (c:Chunk {id: row.id})
+                    WHERE c.lease_owner = $worker
                     SET c.dissonance_checked = true, 
                         c.potential_dissonance = true, 
-                        c.dissonance_report = $report
-                """, {"id": cid, "report": analysis})
+                        c.dissonance_report = row.report,
+                        c.dissonance_skip_reason = null,
+                        c.lease_owner = null,
+                        c.lease_expires = null
+                """, {"rows": flagged, "worker": worker}))
+            if unanswered:
+                statements.append(("""
+                    UNWIND $ids AS cid
+                    MATCH (c:Chunk {id: cid})
+                    WHERE c.lease_owner = $worker
+                    SET c.dissonance_attempts = coalesce(c.dissonance_attempts, 0) + 1,
+                        c.lease_owner = null,
+                        c.lease_expires = null
+                    WITH c WHERE c.dissonance_attempts >= $max_attempts
+                    SET c.dissonance_checked = true,
+                        c.dissonance_skip_reason = $reason
+                """, {"ids": unanswered, "worker": worker,
+                      "max_attempts": DISSONANCE_MAX_ATTEMPTS, "reason": dissonance.SKIP_UNANSWERED}))
+            self._query_neo4j_batch(statements)
+            for cid in [row["id"] for row in skipped + consistent + flagged] + unanswered:
+                pending.remove(cid)
+        finally:
+            self._release_chunks(pending, worker)
+
+        if flagged:
+            # Cached retrievals carry dissonance flags
+            self.result_cache.generation.bump()
+        if skipped:
+            reasons = {}
+            for row in skipped:
+                reasons[row["reason"]] = reasons.get(row["reason"], 0) + 1
+            print(f">> Dissonance triage skipped {len(skipped)} of {len(rows)} chunks without the LLM: {reasons}", file=sys.stderr)
+        checked = len(skipped) + len(consistent) + len(flagged)
+        if rows and not checked:
+            raise RuntimeError(f"The subconscious model answered none of {len(unanswered)} dissonance checks")
+        return checked
+
+    def _process_pending_embeddings(self, limit: int = 10, worker_id: str = None) -> int:
+        """
+        Claims chunks that need embeddings, generates them in one batch request, and
+        writes the vectors back to Neo4j with a single UNWIND.
+        Gives up on a chunk after 3 failed attempts to prevent infinite retries; while
+        Ollama is unreachable the chunks are released without using up an attempt.
+        Returns the number of chunks embedded, and raises when none could be, so the
+        caller backs off instead of reclaiming the same chunks at once.
+        """
+        worker = worker_id or self.worker_id
+        rows = [(r["id"], r["text"], r["failed"]) for r in self._claim_chunks("c.needs_embedding = true", limit, worker)]
+        if not rows:
+            return 0
+
+        import sys
+        embedded, errors = [], []
+        try:
+            vectors = self._embed_batch([text for _, text, _ in rows])
+            embedded = [{"id": cid, "emb": vec} for (cid, _, _), vec in zip(rows, vectors)]
+        except Exception as e:
+            if len(rows) == 1:
+                errors.append((rows[0], e))
             else:
-                self._query_neo4j("MATCH (c:Chunk {id: $id}) SET c.dissonance_checked = true", {"id": cid})
+                # Retry one by one so a single bad input does not fail the whole batch
+                print(f"Batch embedding of {len(rows)} chunks failed ({e}), retrying individually", file=sys.stderr)
+                for row in rows:
+                    try:
+                        embedded.append({"id": row[0], "emb": self._embed_batch([row[1]])[0]})
+                    except Exception as item_error:
+                        errors.append((row, item_error))
+
+        if not embedded and any(self._service_unavailable(e) for _, e in errors):
+            # An outage is not the chunks' fault: keep their attempts for real failures
+            self._release_chunks([cid for cid, _, _ in rows], worker)
+            raise RuntimeError(f"Ollama unavailable, {len(rows)} embeddings postponed: {errors[0][1]}")
+
+        gave_up, retry = [], []
+        for (cid, _, failed), e in errors:
+            failed += 1
+            if failed >= 3:
+                # Give up after 3 attempts
+                gave_up.append({"id": cid, "failed": failed})
+                print(f">> Gave up embedding for chunk: {cid} after {failed} attempts", file=sys.stderr)
+            else:
+                retry.append({"id": cid, "failed": failed})
+                print(f"Error generating embedding for {cid}: {e} (attempt {failed})", file=sys.stderr)
+
+        # Every write is fenced by the lease: if the chunk was edited meanwhile
+        # (update_memory_chunk drops the lease), the stale vector is discarded.
+        statements = []
+        if embedded:
+            statements.append(("""
+                UNWIND $rows AS row
+                MATCH (c:Chunk {id: row.id})
+                WHERE c.lease_owner = $worker
+                SET c.needs_embedding = false, c.failed_attempts = null,
+                    c.lease_owner = null, c.lease_expires = null
+            """ + embedding_assignment("c", "row.emb") + """
+                RETURN c.id
+            """, {"rows": [{"id": e["id"], "emb": self._storage_vector(e["emb"])} for e in embedded], "worker": worker}))
+        if gave_up:
+            statements.append(("""
+                UNWIND $rows AS row
+                MATCH (c:Chunk {id: row.id})
+                WHERE c.lease_owner = $worker
+                SET c.needs_embedding = false, c.failed_attempts = row.failed,
+                    c.lease_owner = null, c.lease_expires = null
+            """, {"rows": gave_up, "worker": worker}))
+        if retry:
+            # Increment failed count
+            statements.append(("""
+                UNWIND $rows AS row
+                MATCH (c:Chunk {id: row.id})
+                WHERE c.lease_owner = $worker
+                SET c.failed_attempts = row.failed, c.lease_owner = null, c.lease_expires = null
+            """, {"rows": retry, "worker": worker}))
+        result = self._query_neo4j_batch(statements)
 
-    def _process_pending_embeddings(self, limit: int = 10):
+        stored = []
+        if embedded:
+            # Only vectors that were actually stored (lease still held) are mirrored
+            stored = [e for e in embedded if e["id"] in {r["row"][0] for r in result["results"][0]["data"]}]
+            self._keep_full("put_many", [(e["id"], e["emb"]) for e in stored])
+            self._mirror("upsert", [(e["id"], "chunk", self._storage_vector(e["emb"])) for e in stored])
+            # Newly embedded chunks become searchable
+            self.result_cache.generation.bump()
+            print(f">> Generated embeddings for {len(embedded)} chunks", file=sys.stderr)
+        if errors and not embedded:
+            raise RuntimeError(f"Embedding failed for all {len(rows)} claimed chunks: {errors[0][1]}")
+        return len(stored)
+
+    @staticmethod
+    def _service_unavailable(error: Exception) -> bool:
         """
-        Finds chunks that need embeddings, generates them, and updates Neo4j.
-        Gives up after 3 failed attempts to prevent infinite retries.
+        True for errors that mean Ollama itself is down or restarting, as opposed to
+        a request it rejected.
         """
-        result = self._query_neo4j("""
-            MATCH (c:Chunk {needs_embedding: true})
-            RETURN c.id as id, c.text as text, coalesce(c.failed_attempts, 0) as failed
-            ORDER BY c.timestamp ASC
-            LIMIT $limit
-        """, {"limit": limit})
-
-        rows = result["results"][0]["data"]
-        for r in rows:
-            cid, text, failed = r["row"][0], r["row"][1], r["row"][2]
-            try:
-                embedding = self._embed(text)
-                self._query_neo4j("""
-                    MATCH (c:Chunk {id: $id})
-                    SET c.embedding = $emb, c.needs_embedding = false, c.failed_attempts = null
-                """, {"id": cid, "emb": embedding})
-                import sys
-                print(f">> Generated embedding for chunk: {cid}", file=sys.stderr)
-            except Exception as e:
-                failed += 1
-                if failed >= 3:
-                    # Give up after 3 attempts
-                    self._query_neo4j("""
-                        MATCH (c:Chunk {id: $id})
-                        SET c.needs_embedding = false, c.failed_attempts = $failed
-                    """, {"id": cid, "failed": failed})
-                    import sys
-                    print(f">> Gave up embedding for chunk: {cid} after {failed} attempts", file=sys.stderr)
-                else:
-                    # Increment failed count
-                    self._query_neo4j("""
-                        MATCH (c:Chunk {id: $id})
-                        SET c.failed_attempts = $failed
-                    """, {"id": cid, "failed": failed})
-                    import sys
-                    print(f"Error generating embedding for {cid}: {e} (attempt {failed})", file=sys.stderr)
-
-    def _update_raptor_tree(self):
-        result = self._query_neo4j("""
-            MATCH (c:Chunk)
-            WHERE NOT (c)<-[:SUMMARIZES]-(:Summary)
-            RETURN c.text as text, c.id as id
-            LIMIT 5 
-        """)
-        
-        rows = result["results"][0]["data"]
-        chunks = [{"text": r["row"][0], "id": r["row"][1]} for r in rows]
-        
-        if len(chunks) < 3: return
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return True
+        response = getattr(error, "response", None)
+        return response is not None and response.status_code in (502, 503, 504)
+
+    def _update_raptor_tree(self, worker_id: str = None) -> int:
+        """
+        Builds the RAPTOR tree bottom-up: embedded chunks without a Summary are
+        clustered by embedding and each cluster is summarized into a level 1 Summary;
+        parentless summaries of each level are then clustered into the next level
+        until a single root remains. Returns the number of nodes summarized.
+        """
+        worker = worker_id or self.worker_id
+        summarized = self._summarize_level(0, worker)
+        result = self._query_neo4j("MATCH (s:Summary) RETURN max(s.level)", read_only=True)
+        top = result["results"][0]["data"][0]["row"][0] or 0
+        level = 1
+        while level <= top:
+            created = self._summarize_level(level, worker, has_parents=level < top)
+            if created:
+                summarized += created
+                top = max(top, level + 1)
+            level += 1
+        return summarized
 
-        # --- Advanced Summarization via LLM ---
-        combined_text = " ".join([c['text'] for c in chunks])
-        prompt = f"""
-        Summarize the following text into a concise, high-level abstract.
-        Text: {combined_text}
+    def _summarize_level(self, level: int, worker: str, has_parents: bool = False) -> int:
         """
-        summary_text = self._chat(prompt)
-        if not summary_text:
-             summary_text = f"Summary: {combined_text[:200]}..."
+        Summarizes the parentless nodes of one level (0 = chunks) into clusters of
+        about RAPTOR_CLUSTER_SIZE, one Summary of level + 1 per cluster. A single
+        parentless summary below the top joins its nearest parent instead.
+        """
+        import sys
+        if level == 0:
+            label, minimum = "Chunk", RAPTOR_MIN_CLUSTER
+            condition = "c.needs_embedding = false AND c.embedding IS NOT NULL AND NOT (c)<-[:SUMMARIZES]-(:Summary)"
+        else:
+            label, minimum = "Summary", 2
+            # Dirty summaries are grouped only once they have been refreshed
+            condition = "c.level = $level AND c.embedding IS NOT NULL AND coalesce(c.dirty, false) = false AND NOT (c)<-[:SUMMARIZES]-(:Summary)"
+        # Leasing keeps concurrent workers from summarizing overlapping node sets
+        nodes = self._claim_nodes(label, condition, RAPTOR_BATCH_SIZE, worker, {"level": level}, with_embedding=True)
+        if len(nodes) == 1 and level > 0 and has_parents:
+            return self._attach_to_parent(nodes[0], level, worker)
+        if len(nodes) < minimum:
+            # Too few to summarize yet (or the root)
+            self._release_nodes(label, [n["id"] for n in nodes], worker)
+            return 0
+
+        pending = [n["id"] for n in nodes]
+        summarized = 0
+        try:
+            groups = raptor.cluster(np.asarray([n["embedding"] for n in nodes]), RAPTOR_CLUSTER_SIZE, min_size=minimum)
+            for members in groups:
+                children = [nodes[m] for m in members]
 
-        summary_vec = self._embed(summary_text)
-        summary_id = str(uuid.uuid4())
+                # --- Advanced Summarization via LLM ---
+                combined_text = " ".join([c['text'] for c in children])
+                prompt = f"""
+                Summarize the following text into a concise, high-level abstract.
+                Text: {combined_text}
+                """
+                summary_text = self._chat(prompt)
+                if not summary_text:
+                     summary_text = f"Summary: {combined_text[:200]}..."
+                summary_vec = self._embed(summary_text)
 
+                child_ids = [c["id"] for c in children]
+                summary_id = str(uuid.uuid4())
+                stored_vec = self._storage_vector(summary_vec)
+                assign_embedding = embedding_assignment("s", "$svec")
+                self._query_neo4j(f"""
+                    CREATE (s:Summary {{
+                        id: $sid, 
+                        text: $stext, 
+                        level: $level,
+                        timestamp: datetime()
+                    }})
+                    {assign_embedding}
+                    WITH s
+                    UNWIND $child_ids as cid
+                    MATCH (c:{label} {{id: cid}})
+                    WHERE c.lease_owner = $worker
+                    MERGE (s)-[:SUMMARIZES]->(c)
+                    SET c.lease_owner = null, c.lease_expires = null
+                """, {"sid": summary_id, "stext": summary_text, "svec": stored_vec,
+                      "level": level + 1, "child_ids": child_ids, "worker": worker})
+                self._keep_full("put_many", [(summary_id, summary_vec)])
+                self._mirror("upsert", [(summary_id, "summary", stored_vec)])
+                for cid in child_ids:
+                    pending.remove(cid)
+                summarized += len(children)
+                # A large batch can outlive the lease while the LLM works through it
+                self._release_nodes(label, pending, worker, renew=True)
+                print(f">> RAPTOR: Created Level {level + 1} Summary for {len(children)} nodes.", file=sys.stderr)
+        finally:
+            self._release_nodes(label, pending, worker)
+
+        if summarized:
+            self.result_cache.generation.bump()
+        return summarized
+
+    def _attach_to_parent(self, node: Dict[str, Any], level: int, worker: str) -> int:
+        """
+        Hangs a lone parentless summary under the closest summary of the next level,
+        and marks that parent and the summaries above it for a refresh.
+        """
+        result = self._query_neo4j("""
+            MATCH (p:Summary {level: $level})
+            RETURN p.id, p.embedding
+        """, {"level": level + 1}, read_only=True)
+        parents = [r["row"] for r in result["results"][0]["data"] if r["row"][1] is not None]
+        if not parents:
+            self._release_nodes("Summary", [node["id"]], worker)
+            return 0
+
+        matrix = np.asarray([embedding for _, embedding in parents], dtype=np.float32)
+        vector = np.asarray(node["embedding"], dtype=np.float32)
+        similarities = matrix @ vector / np.maximum(np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector), 1e-12)
+        parent_id = parents[int(np.argmax(similarities))][0]
         self._query_neo4j("""
-            CREATE (s:Summary {
-                id: $sid, 
-                text: $stext, 
-                embedding: $svec, 
-                level: 1,
-                timestamp: datetime()
-            })
-            WITH s
-            UNWIND $child_ids as cid
-            MATCH (c:Chunk {id: cid})
-            MERGE (s)-[:SUMMARIZES]->(c)
-        """, {"sid": summary_id, "stext": summary_text, "svec": summary_vec, "child_ids": [c['id'] for c in chunks]})
+            MATCH (p:Summary {id: $pid})
+            MATCH (s:Summary {id: $sid})
+            WHERE s.lease_owner = $worker
+            MERGE (p)-[:SUMMARIZES]->(s)
+            SET s.lease_owner = null, s.lease_expires = null
+            WITH p
+            MATCH (a:Summary)-[:SUMMARIZES*0..]->(p)
+            WITH DISTINCT a
+            SET a.dirty = true, a.lease_owner = null, a.lease_expires = null
+        """, {"pid": parent_id, "sid": node["id"], "worker": worker})
+        self.result_cache.generation.bump()
+        return 1
+
+    @staticmethod
+    def _dirty_ancestors_statement(chunk_id: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Marks every Summary above a chunk as needing a refresh. Dropping the lease
+        fences off a refresh already in flight, so it cannot clear the new mark.
+        """
+        return ("""
+            MATCH (s:Summary)-[:SUMMARIZES*1..]->(:Chunk {id: $id})
+            WITH DISTINCT s
+            SET s.dirty = true, s.lease_owner = null, s.lease_expires = null
+        """, {"id": chunk_id})
+
+    def _refresh_dirty_summaries(self, worker_id: str = None, limit: int = 8) -> int:
+        """
+        Recomputes summaries marked dirty by an edit, lowest level first: a summary is
+        only claimed once none of its child summaries is dirty, so it is rewritten from
+        up-to-date texts. Summaries left without children are deleted and their parent
+        is refreshed in turn. Returns the number of summaries processed.
+        """
         import sys
-        print(f">> RAPTOR: Created Level 1 Summary for {len(chunks)} chunks.", file=sys.stderr)
+        worker = worker_id or self.worker_id
+        claimed = self._claim_nodes(
+            "Summary", "c.dirty = true AND NOT (c)-[:SUMMARIZES]->(:Summary {dirty: true})", limit, worker,
+        )
+        if not claimed:
+            return 0
+
+        pending = [c["id"] for c in claimed]
+        refreshed, removed = 0, 0
+        try:
+            result = self._query_neo4j("""
+                UNWIND $ids AS sid
+                MATCH (s:Summary {id: sid})
+                OPTIONAL MATCH (s)-[:SUMMARIZES]->(child)
+                RETURN sid, [text IN collect(child.text) WHERE text IS NOT NULL]
+            """, {"ids": pending}, read_only=True)
+            children = {r["row"][0]: r["row"][1] for r in result["results"][0]["data"]}
+
+            empty = [sid for sid in pending if not children.get(sid)]
+            if empty:
+                self._query_neo4j("""
+                    UNWIND $ids AS sid
+                    MATCH (s:Summary {id: sid})
+                    WHERE s.lease_owner = $worker
+                    OPTIONAL MATCH (parent:Summary)-[:SUMMARIZES]->(s)
+                    WITH s, collect(parent) as parents
+                    FOREACH (p IN parents | SET p.dirty = true)
+                    DETACH DELETE s
+                """, {"ids": empty, "worker": worker})
+                self._mirror("remove", empty)
+                self._keep_full("remove", empty)
+                for sid in empty:
+                    pending.remove(sid)
+                removed = len(empty)
+
+            for sid in list(pending):
+                combined_text = " ".join(children[sid])
+                prompt = f"""
+                Summarize the following text into a concise, high-level abstract.
+                Text: {combined_text}
+                """
+                summary_text = self._chat(prompt)
+                if not summary_text:
+                     summary_text = f"Summary: {combined_text[:200]}..."
+                summary_vec = self._embed(summary_text)
+                stored_vec = self._storage_vector(summary_vec)
+                self._query_neo4j("""
+                    MATCH (s:Summary {id: $sid})
+                    WHERE s.lease_owner = $worker
+                    SET s.text = $stext,
+                        s.dirty = false,
+                        s.refreshed_at = datetime(),
+                        s.lease_owner = null,
+                        s.lease_expires = null
+                """ + embedding_assignment("s", "$svec"),
+                    {"sid": sid, "stext": summary_text, "svec": stored_vec, "worker": worker})
+                self._keep_full("put_many", [(sid, summary_vec)])
+                self._mirror("upsert", [(sid, "summary", stored_vec)])
+                pending.remove(sid)
+                refreshed += 1
+        finally:
+            self._release_nodes("Summary", pending, worker)
+
+        self.result_cache.generation.bump()
+        print(f">> RAPTOR: Refreshed {refreshed} and removed {removed} outdated summaries.", file=sys.stderr)
+        return refreshed + removed
 
     def forget_memory(self, chunk_id: str):
         """
         Removes a specific chunk and prunes orphan entities/relationships.
         """
-        # 1. Delete the chunk and its mentions
-        self._query_neo4j("""
-            MATCH (c:Chunk {id: $id})
-            DETACH DELETE c
-        """, {"id": chunk_id})
-        
-        # 2. Prune entities that no longer have any mentions
-        self._query_neo4j("""
-            MATCH (e:Entity)
-            WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
-            DETACH DELETE e
-        """)
+        self._query_neo4j_batch([
+            # 1. Summaries built on the chunk must be recomputed
+            self._dirty_ancestors_statement(chunk_id),
+            # 2. Delete the chunk and its mentions
+            ("""
+                MATCH (c:Chunk {id: $id})
+                DETACH DELETE c
+            """, {"id": chunk_id}),
+            # 3. Prune entities that no longer have any mentions
+            ("""
+                MATCH (e:Entity)
+                WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
+                DETACH DELETE e
+            """, {}),
+        ])
         
-        # 3. TODO: Recalculate RAPTOR summaries if needed
+        self._mirror("remove", [chunk_id])
+        self._keep_full("remove", [chunk_id])
+        self.result_cache.generation.bump()
+        # The metabolism refreshes the dirty summaries
+        notify_metabolism(WAKEUP_DIR)
         import sys
         print(f">> Pruned memory chunk: {chunk_id}", file=sys.stderr)
 
-    def prune_weak_connections(self, threshold: float = 0.5):
+    def update_memory_chunk(self, chunk_id: str, new_text: str):
         """
-        Removes relationships that have decayed below a threshold and prunes orphan entities.
+        Replaces the text of a chunk and resets its flags so the metabolism re-processes it.
+        """
+        # Update text and reset flags to trigger re-processing; dropping the lease fences
+        # off any worker still processing the old text
+        self._query_neo4j_batch([self._dirty_ancestors_statement(chunk_id), ("""
+            MATCH (c:Chunk {id: $id})
+            SET c.text = $text, 
+                c.needs_embedding = true, 
+                c.dissonance_checked = false, 
+                c.potential_dissonance = null,
+                c.dissonance_report = null,
+                c.dissonance_skip_reason = null,
+                c.lease_owner = null,
+                c.lease_expires = null
+        """, {"id": chunk_id, "text": new_text})])
+        # The old vector no longer matches the text
+        self._mirror("remove", [chunk_id])
+        self._keep_full("remove", [chunk_id])
+        self.result_cache.generation.bump()
+        notify_metabolism(WAKEUP_DIR)
+
+    def accept_dissonance(self, chunk_id: str):
+        """
+        Marks a flagged dissonance as reviewed and accepted, keeping the memory as is.
         """
-        # Delete weak relationships
-        self._query_neo4j("""
-            MATCH ()-[r:RELATED_TO]->()
-            WHERE r.weight <= $threshold
-            DELETE r
-        """, {"threshold": threshold})
-        
-        # Prune orphaned entities (no mentions AND no relationships)
         self._query_neo4j("""
+            MATCH (c:Chunk {id: $id})
+            SET c.potential_dissonance = false, 
+                c.dissonance_resolved = true,
+                c.dissonance_report = null
+        """, {"id": chunk_id})
+        self.result_cache.generation.bump()
+
+    @staticmethod
+    def _prune_statements(threshold: float, entities: List[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        Statements that remove weak edges and orphan entities, graph-wide or, when
+        entities are given, only around those entities.
+        """
+        if entities is not None:
+            return [
+                ("""
+                    UNWIND $names AS name
+                    MATCH (e:Entity {name: name})-[r:RELATED_TO]-()
+                    WHERE r.weight <= $threshold
+                    WITH DISTINCT r
+                    DELETE r
+                """, {"names": entities, "threshold": threshold}),
+                ("""
+                    UNWIND $names AS name
+                    MATCH (e:Entity {name: name})
+                    WHERE NOT (e)<-[:MENTIONS]-(:Chunk) 
+                      AND NOT (e)-[:RELATED_TO]-()
+                    DETACH DELETE e
+                """, {"names": entities}),
+            ]
+        return [
+            # Delete weak relationships
+            ("""
+                MATCH ()-[r:RELATED_TO]->()
+                WHERE r.weight <= $threshold
+                DELETE r
+            """, {"threshold": threshold}),
+            # Prune orphaned entities (no mentions AND no relationships)
+            ("""
+                MATCH (e:Entity)
+                WHERE NOT (e)<-[:MENTIONS]-(:Chunk) 
+                  AND NOT (e)-[:RELATED_TO]-()
+                DETACH DELETE e
+            """, {}),
+        ]
+
+    def prune_weak_connections(self, threshold: float = 0.5, entities: List[str] = None):
+        """
+        Removes relationships that have decayed below a threshold and prunes orphan entities.
+        Scans the whole graph unless `entities` restricts it to their neighbourhood;
+        the metabolism uses prune_weak_connections_batch instead.
+        """
+        self._query_neo4j_batch(self._prune_statements(threshold, entities=entities))
+        self.result_cache.generation.bump()
+
+    def prune_weak_connections_batch(self, cursor: str = "", batch_size: int = PRUNE_BATCH_SIZE, threshold: float = 0.5) -> Tuple[str, int]:
+        """
+        Incremental decay and pruning: visits the next `batch_size` entities after
+        `cursor` (in name order, served by the Entity.name constraint index) in one
+        transaction, decaying the weights of their outgoing edges by the time since the
+        last decay, then removing the weak edges and the entities left orphaned.
+        Returns the cursor for the next call ("" once the sweep wrapped around) and the
+        number of removed edges. Decayed edges are stamped with `updated_at`, so graph
+        snapshots pick the new weights up through their change feed.
+        """
+        window = """
             MATCH (e:Entity)
-            WHERE NOT (e)<-[:MENTIONS]-(:Chunk) 
-              AND NOT (e)-[:RELATED_TO]-()
-            DETACH DELETE e
-        """)
+            WHERE e.name > $cursor
+            WITH e ORDER BY e.name ASC LIMIT $batch
+        """
+        params = {"cursor": cursor, "batch": batch_size, "threshold": threshold}
+        statements = [
+            (window + """
+                RETURN count(e) as visited, max(e.name) as last
+            """, params),
+        ]
+        if EDGE_HALF_LIFE_DAYS > 0:
+            statements.append((window + f"""
+                MATCH (e)-[r:RELATED_TO]->()
+                SET r.weight = {decayed_weight("r")}, r.decayed_at = timestamp(), r.updated_at = timestamp()
+                RETURN count(r) as decayed
+            """, params))
+        res = self._query_neo4j_batch(statements + [
+            (window + """
+                MATCH (e)-[r:RELATED_TO]->()
+                WHERE r.weight <= $threshold
+                DELETE r
+                RETURN count(r) as removed
+            """, params),
+            (window + """
+                WITH e
+                WHERE NOT (e)<-[:MENTIONS]-(:Chunk) 
+                  AND NOT (e)-[:RELATED_TO]-()
+                DETACH DELETE e
+            """, params),
+        ])
+        visited, last = res["results"][0]["data"][0]["row"]
+        removed = res["results"][len(statements)]["data"][0]["row"][0]
+        decayed = res["results"][1]["data"][0]["row"][0] if EDGE_HALF_LIFE_DAYS > 0 else 0
+        if removed or decayed:
+            self.result_cache.generation.bump()
+        next_cursor = last if visited == batch_size else ""
+        return next_cursor, removed
 
-    def retrieve(self, query: str, top_k: int = 3):
-        query_vec = self._embed(query)
-        
-        episodic_res = self._query_neo4j("""
-            CALL db.index.vector.queryNodes('chunk_embeddings', $k, $vec)
-            YIELD node, score
-            RETURN node.text as text, score
-        """, {"k": top_k, "vec": query_vec})
-        
-        raptor_res = self._query_neo4j("""
-            CALL db.index.vector.queryNodes('summary_embeddings', 2, $vec)
-            YIELD node, score
-            RETURN node.text as text, score
-        """, {"vec": query_vec})
-
-        # --- Hybrid Search: Keyword Extraction via LLM ---
-        # Optimized: Use heuristic extraction for speed, fallback to LLM only if needed
-        # For now, we stick to heuristic to avoid latency on retrieval
-        keywords = [w.strip(".,!?") for w in query.split() if w[0].isupper() and len(w) > 1]
-        
-        graph_context = []
+    def recall_graph(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Rapid recall from the Knowledge Graph only (no embedding, no LLM).
+        Answered from the in-process graph snapshot, strongest facts first, once it is
+        loaded; from Neo4j until then.
+        """
+        # Known entity names are matched locally to stay fast
+        keywords = self._query_entities(query, self.entities)
+        if self.graph is not None:
+            facts = self.graph.facts(keywords, limit)
+            if facts is not None:
+                return facts
+
+        cache_key = ResultCache.key(query, limit, "fast")
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        generation = self.result_cache.generation.current()
+
+        facts = []
         if keywords:
-            res = self._query_neo4j("""
-                MATCH (e:Entity)
-                WHERE e.name IN $keywords
-                MATCH (e)-[r:RELATED_TO]-(neighbor)
-                RETURN e.name + ' is related to ' + neighbor.name as fact
-                LIMIT 5
-            """, {"keywords": keywords})
-            graph_context = [r["row"][0] for r in res["results"][0]["data"]]
+            res = self._query_neo4j(
+                GRAPH_FACTS_SUBQUERY + "RETURN facts",
+                {"keywords": keywords, "fact_limit": limit},
+                read_only=True,
+            )
+            facts = res["results"][0]["data"][0]["row"][0]
+
+        self.result_cache.put(cache_key, facts, generation)
+        return facts
+
+    @staticmethod
+    def _graph_context(graph: EntityGraph, keywords: List[str]) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Graph relevance from the in-process snapshot: the entities related to the
+        query's ones across several hops (personalised PageRank) as [{name, score}],
+        and the strongest direct facts. ([], None) while the snapshot is unavailable,
+        so the facts come from Cypher.
+        """
+        related = graph.related_entities(keywords, GRAPH_RELATED_ENTITIES) if graph is not None else None
+        if related is None:
+            return [], None
+        return [{"name": name, "score": score} for name, score in related], graph.facts(keywords, 5)
 
+    @staticmethod
+    def _retrieval_results(episodic: List[Dict[str, Any]], summaries: List[str], facts: List[str],
+                           related: List[Dict[str, Any]] = None, graph_hits: List[Dict[str, Any]] = None,
+                           top_k: int = 3) -> Dict[str, Any]:
+        # Graph memories complement the episodic hits, so direct hits are not repeated
+        seen = {hit["id"] for hit in episodic}
+        graph_hits = [hit for hit in graph_hits or [] if hit["id"] not in seen][:top_k]
         return {
-            "episodic_hits": [r["row"][0] for r in episodic_res["results"][0]["data"]],
-            "raptor_summary": [r["row"][0] for r in raptor_res["results"][0]["data"]],
-            "knowledge_graph": graph_context
+            "episodic_hits": [hit["text"] for hit in episodic],
+            "episodic_details": episodic,
+            "raptor_summary": summaries,
+            "knowledge_graph": facts,
+            "related_entities": [entity["name"] for entity in related or []],
+            "graph_memories": [hit["text"] for hit in graph_hits],
         }
 
+    @staticmethod
+    def _mirror_search(index: LocalVectorIndex, query_vec: List[float], top_k: int):
+        """
+        Ranks chunks and summaries in the local vector mirror. Returns ([{id, score}]
+        chunk hits, [{id, score}] summary hits), or None when the mirror is disabled,
+        not fully synced yet, or failing, so callers fall back to the Neo4j index.
+        Hits are over-fetched to absorb chunks deleted since the last sync.
+        """
+        if index is None:
+            return None
+        try:
+            if not index.ready():
+                return None
+            hits = [{"id": i, "score": score} for i, score in index.search(query_vec, 2 * top_k, kind="chunk")]
+            summary_hits = [{"id": i, "score": score} for i, score in index.search(query_vec, 4, kind="summary")]
+            return hits, summary_hits
+        except Exception as e:
+            import sys
+            print(f"Warning: Vector mirror search failed, using Neo4j: {e}", file=sys.stderr)
+            return None
+
+    def sync_vector_mirror_batch(self, kind: str = "chunk", cursor: str = "", batch_size: int = VECTOR_MIRROR_SYNC_BATCH) -> str:
+        """
+        Reconciles one id-ordered page of chunks or summaries with the local mirror:
+        missing vectors are copied, mirrored ids that no longer exist are dropped.
+        Returns the cursor for the next page, or "" once the sweep of `kind` is done.
+        """
+        if self.vector_index is None:
+            return ""
+        label = "Chunk" if kind == "chunk" else "Summary"
+        result = self._query_neo4j(f"""
+            MATCH (n:{label})
+            WHERE n.id > $cursor AND n.embedding IS NOT NULL
+            RETURN n.id
+            ORDER BY n.id
+            LIMIT $batch
+        """, {"cursor": cursor, "batch": batch_size}, read_only=True)
+        ids = [r["row"][0] for r in result["results"][0]["data"]]
+        last = len(ids) < batch_size
+
+        stale = set(self.vector_index.ids_between(kind, cursor, None if last else ids[-1])) - set(ids)
+        self.vector_index.remove(sorted(stale))
+        missing = self.vector_index.missing(ids)
+        if missing:
+            result = self._query_neo4j(f"""
+                UNWIND $ids AS nid
+                MATCH (n:{label} {{id: nid}})
+                WHERE n.embedding IS NOT NULL
+                RETURN n.id, n.embedding
+            """, {"ids": missing}, read_only=True)
+            self.vector_index.upsert([(r["row"][0], kind, r["row"][1]) for r in result["results"][0]["data"]])
+        return "" if last else ids[-1]
+
+    def _fetch_size(self, top_k: int) -> int:
+        return top_k * COMPACT_RERANK_FACTOR if self.full_vectors is not None else top_k
+
+    def vector_search(self, query_vec: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Episodic vector search alone ([{id, score}] best first), through the same path
+        as retrieve: local mirror or Neo4j index, plus the compact-mode rerank.
+        """
+        index_vec, fetch_k = self._storage_vector(query_vec), self._fetch_size(top_k)
+        mirrored = self._mirror_search(self.vector_index, index_vec, fetch_k)
+        if mirrored is not None:
+            hits = mirrored[0][:fetch_k]
+        else:
+            res = self._query_neo4j(EPISODIC_SUBQUERY + "RETURN episodic", {"k": fetch_k, "vec": index_vec}, read_only=True)
+            hits = [{"id": e["id"], "score": e["score"]} for e in res["results"][0]["data"][0]["row"][0]]
+        return rerank(query_vec, hits, self.full_vectors, top_k)
+
+    def retrieve(self, query: str, top_k: int = 3):
+        cache_key = ResultCache.key(query, top_k, "holographic")
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        # Read before computing, so a write racing with this retrieval invalidates it
+        generation = self.result_cache.generation.current()
+
+        query_vec = self._embed(query)
+
+        # --- Hybrid Search: entities matched locally by the gazetteer, no LLM latency ---
+        keywords = self._query_entities(query, self.entities)
+        # Multi-hop graph relevance is ranked in process; Neo4j only reads the mentions
+        related, facts = self._graph_context(self.graph, keywords)
+        graph_query = (GRAPH_FACTS_SUBQUERY if facts is None else PROVIDED_FACTS_SUBQUERY) + GRAPH_MEMORIES_SUBQUERY
+        graph_params = {"keywords": keywords, "fact_limit": 5, "facts": facts, "related": related, "graph_k": 2 * top_k}
+
+        # Compact storage searches the truncated vectors and reranks a larger candidate set
+        index_vec, fetch_k = self._storage_vector(query_vec), self._fetch_size(top_k)
+
+        # Episodic hits (with their dissonance flags), RAPTOR summaries, graph facts and
+        # graph memories are fetched by one statement: a single database round trip after embedding.
+        mirrored = self._mirror_search(self.vector_index, index_vec, fetch_k)
+        if mirrored is not None:
+            # Ranked locally: Neo4j only resolves the ids
+            hits, summary_hits = mirrored
+            res = self._query_neo4j(
+                MIRRORED_EPISODIC_SUBQUERY + MIRRORED_SUMMARY_SUBQUERY + graph_query + "RETURN episodic, summaries, facts, graph_hits",
+                {"k": fetch_k, "hits": hits, "summary_hits": summary_hits, **graph_params},
+                read_only=True,
+            )
+        else:
+            res = self._query_neo4j(
+                EPISODIC_SUBQUERY + SUMMARY_SUBQUERY + graph_query + "RETURN episodic, summaries, facts, graph_hits",
+                {"k": fetch_k, "vec": index_vec, **graph_params},
+                read_only=True,
+            )
+        episodic, summaries, facts, graph_hits = res["results"][0]["data"][0]["row"]
+        episodic = rerank(query_vec, episodic, self.full_vectors, top_k)
+
+        results = self._retrieval_results(episodic, summaries, facts, related, graph_hits, top_k)
+        self.result_cache.put(cache_key, results, generation)
+        return results
+
 def main():
     brain = CognitiveMemory()
     try:
@@ -489,7 +1749,7 @@ def main():
         print(f"Query: {query}")
         print(f"Facts: {context['knowledge_graph']}")
     finally:
-        pass
+        brain.close()
 
 if __name__ == "__main__":
     main()
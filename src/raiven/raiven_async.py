@@ -0,0 +1,356 @@
+import sys
+import asyncio
+import httpx
+from typing import List, Dict, Any, Tuple
+
+from . import (
+    CognitiveMemory,
+    EmbeddingCache,
+    GenerationCounter,
+    ResultCache,
+    LocalVectorIndex,
+    FullVectorStore,
+    EntityGazetteer,
+    EntityGraph,
+    rerank,
+    neo4j_endpoint,
+    notify_metabolism,
+    EPISODIC_SUBQUERY,
+    SUMMARY_SUBQUERY,
+    MIRRORED_EPISODIC_SUBQUERY,
+    MIRRORED_SUMMARY_SUBQUERY,
+    GRAPH_FACTS_SUBQUERY,
+    PROVIDED_FACTS_SUBQUERY,
+    GRAPH_MEMORIES_SUBQUERY,
+    NEO4J_DATABASE,
+    NEO4J_USER,
+    NEO4J_PASSWORD,
+    NEO4J_MAX_POOL_SIZE,
+    NEO4J_ACQUISITION_TIMEOUT,
+    NEO4J_MAX_RETRY_TIME,
+    HTTP_POOL_MAXSIZE,
+    OLLAMA_HOST,
+    OLLAMA_API_KEY,
+    OLLAMA_EMBED_TIMEOUT,
+    EMBEDDING_MODEL,
+    CHAT_MODEL,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_PATH,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+    COMPACT_DIMENSIONS,
+    COMPACT_RERANK_FACTOR,
+    compact_vector,
+    WAKEUP_DIR,
+    SESSION_PAGE_SIZE,
+)
+
+class AsyncCognitiveMemory:
+    """
+    Asyncio counterpart of CognitiveMemory for the interactive paths: ingestion,
+    retrieval and chat. Ollama is called through httpx.AsyncClient and Neo4j through
+    the async driver (or the REST API), so a slow model call only suspends its own
+    request instead of blocking the whole MCP server.
+
+    Schema initialisation and the background consolidation stay on the synchronous
+    CognitiveMemory; caches (and the local vector mirror) can be shared with it so
+    both see the same invalidations.
+    """
+    def __init__(self, database: str = None, embedding_cache: EmbeddingCache = None, result_cache: ResultCache = None,
+                 vector_index: LocalVectorIndex = None, full_vectors: FullVectorStore = None,
+                 entities: EntityGazetteer = None, graph: EntityGraph = None):
+        self.database = database or NEO4J_DATABASE or "neo4j"
+        self.neo4j_url, self.neo4j_headers = neo4j_endpoint(self.database)
+
+        self._driver = None
+        if self.neo4j_url.startswith("bolt"):
+            from neo4j import AsyncGraphDatabase
+            self._driver = AsyncGraphDatabase.driver(
+                self.neo4j_url,
+                auth=(NEO4J_USER, NEO4J_PASSWORD),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT,
+                max_transaction_retry_time=NEO4J_MAX_RETRY_TIME,
+                keep_alive=True,
+            )
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_POOL_MAXSIZE, max_keepalive_connections=HTTP_POOL_MAXSIZE),
+            # Only connection failures are retried, as on the synchronous path
+            transport=httpx.AsyncHTTPTransport(retries=3),
+            timeout=None,
+        )
+
+        self.embedding_cache = embedding_cache or EmbeddingCache(max_entries=EMBEDDING_CACHE_SIZE, path=EMBEDDING_CACHE_PATH)
+        self.result_cache = result_cache or ResultCache(
+            GenerationCounter(path=EMBEDDING_CACHE_PATH),
+            max_entries=RESULT_CACHE_SIZE,
+            ttl_seconds=RESULT_CACHE_TTL,
+        )
+        self.vector_index = vector_index
+        # Compact storage mode: full-precision vectors for reranking
+        self.full_vectors = full_vectors
+        # Entity gazetteer of the synchronous core (heuristic extraction without it)
+        self.entities = entities
+        # Entity graph snapshot of the synchronous core for fast-mode recall
+        self.graph = graph
+
+    async def close(self):
+        """
+        Releases the pooled Neo4j and HTTP connections.
+        """
+        if self._driver is not None:
+            await self._driver.close()
+            self._driver = None
+        await self._http.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @staticmethod
+    async def _run_transaction(tx, statements: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Any]:
+        # Format to match the REST API response structure expected by other methods
+        data = {"results": [], "errors": []}
+        for cypher, parameters in statements:
+            result = await tx.run(cypher, parameters or {})
+            rows = [{"row": list(record.values())} async for record in result]
+            data["results"].append({"columns": list(result.keys()), "data": rows})
+        return data
+
+    async def _query_neo4j_batch(self, statements: List[Tuple[str, Dict[str, Any]]], read_only: bool = False) -> Dict[str, Any]:
+        """
+        Executes several Cypher statements in a single transaction and a single round trip.
+        """
+        if not statements:
+            return {"results": [], "errors": []}
+
+        if self._driver is not None:
+            async with self._driver.session(database=self.database) as session:
+                if read_only:
+                    return await session.execute_read(self._run_transaction, statements)
+                return await session.execute_write(self._run_transaction, statements)
+
+        payload = {
+            "statements": [
+                {
+                    "statement": cypher,
+                    "parameters": parameters or {}
+                }
+                for cypher, parameters in statements
+            ]
+        }
+        response = await self._http.post(self.neo4j_url, json=payload, headers=self.neo4j_headers)
+        response.raise_for_status()
+
+        data = response.json()
+        if data.get("errors"):
+            raise Exception(f"Neo4j Error: {data['errors']}")
+        return data
+
+    async def _query_neo4j(self, cypher: str, parameters: Dict[str, Any] = None, read_only: bool = False,
+                           managed: bool = True) -> Dict[str, Any]:
+        """
+        See CognitiveMemory._query_neo4j: `managed=False` runs the query once in an
+        auto-commit transaction instead of a retried transaction function.
+        """
+        if self._driver is not None and not managed:
+            async with self._driver.session(database=self.database) as session:
+                return await self._run_transaction(session, [(cypher, parameters)])
+        return await self._query_neo4j_batch([(cypher, parameters)], read_only=read_only)
+
+    async def _request_embeddings(self, texts: List[str]) -> List[List[float]]:
+        url = f"{OLLAMA_HOST.rstrip('/')}/api/embed"
+        headers = {"X-Api-Key": OLLAMA_API_KEY} if OLLAMA_API_KEY else {}
+        payload = {
+            "model": EMBEDDING_MODEL,
+            "input": texts
+        }
+
+        try:
+            response = await self._http.post(url, json=payload, headers=headers, timeout=OLLAMA_EMBED_TIMEOUT)
+            response.raise_for_status()
+            embeddings = response.json()["embeddings"]
+            if len(embeddings) != len(texts):
+                raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+            return embeddings
+        except Exception as e:
+            print(f"Error calling Ollama: {e}", file=sys.stderr)
+            raise
+
+    def _cached_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self.embedding_cache.get(EMBEDDING_MODEL, text) for text in texts]
+
+    def _cache_embeddings(self, fetched: Dict[str, List[float]]):
+        for text, vec in fetched.items():
+            self.embedding_cache.put(EMBEDDING_MODEL, text, vec)
+
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # The embedding cache may read and write its SQLite file: off the event loop
+        vectors = await asyncio.to_thread(self._cached_embeddings, texts)
+        missing = list(dict.fromkeys(text for text, vec in zip(texts, vectors) if vec is None))
+        if missing:
+            fetched = dict(zip(missing, await self._request_embeddings(missing)))
+            await asyncio.to_thread(self._cache_embeddings, fetched)
+            vectors = [vec if vec is not None else fetched[text] for text, vec in zip(texts, vectors)]
+        return vectors
+
+    async def _embed(self, text: str) -> List[float]:
+        return (await self._embed_batch([text]))[0]
+
+    async def _chat(self, prompt: str, model: str = None) -> str:
+        """
+        Generates a completion using the configured chat model.
+        """
+        target_model = model or CHAT_MODEL
+        url = f"{OLLAMA_HOST.rstrip('/')}/api/generate"
+        headers = {"X-Api-Key": OLLAMA_API_KEY} if OLLAMA_API_KEY else {}
+        payload = {
+            "model": target_model,
+            "prompt": prompt,
+            "stream": False
+        }
+
+        try:
+            response = await self._http.post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            return response.json()["response"]
+        except Exception as e:
+            print(f"Error calling Ollama Chat ({target_model}): {e}", file=sys.stderr)
+            return ""
+
+    async def add_memories(self, items: List[Dict[str, Any]], prune_threshold: float = None) -> List[str]:
+        """
+        Bulk ingestion in one transaction, see CognitiveMemory.add_memories.
+        """
+        if not items:
+            return []
+        # Entity matching may refresh the gazetteer, which reads the SQLite generation
+        chunk_ids, statements = await asyncio.to_thread(
+            CognitiveMemory._build_ingest_statements, items, prune_threshold=prune_threshold, gazetteer=self.entities,
+        )
+        await self._query_neo4j_batch(statements)
+        if self.entities is not None:
+            self.entities.add(name for chunk in statements[0][1]["chunks"] for name in chunk["entities"])
+        await asyncio.to_thread(self.result_cache.generation.bump)
+        # Scans the wake-up directory and may unlink stale sockets
+        await asyncio.to_thread(notify_metabolism, WAKEUP_DIR)
+        return chunk_ids
+
+    async def add_memory(self, text: str, role: str = "user", entities: List[str] = None) -> str:
+        return (await self.add_memories([{"text": text, "role": role, "entities": entities}], prune_threshold=0.5))[0]
+
+    async def get_session_messages(self, session_id: str, cursor: int = None, limit: int = SESSION_PAGE_SIZE,
+                                   since: str = None, until: str = None, tail: bool = False) -> Dict[str, Any]:
+        """
+        One page of a session log, see CognitiveMemory.get_session_messages.
+        """
+        cypher, params = CognitiveMemory._session_page_statement(session_id, cursor, limit, since, until, tail)
+        res = await self._query_neo4j(cypher, params, read_only=True)
+        return CognitiveMemory._session_page([r["row"] for r in res["results"][0]["data"]], limit, tail)
+
+    async def _graph_facts(self, keywords: List[str], limit: int) -> List[str]:
+        if not keywords:
+            return []
+        res = await self._query_neo4j(
+            GRAPH_FACTS_SUBQUERY + "RETURN facts",
+            {"keywords": keywords, "fact_limit": limit},
+            read_only=True,
+        )
+        return res["results"][0]["data"][0]["row"][0]
+
+    async def recall_graph(self, query: str, limit: int = 10) -> List[str]:
+        """
+        Rapid recall from the Knowledge Graph only (no embedding, no LLM), see
+        CognitiveMemory.recall_graph.
+        """
+        keywords, facts = await asyncio.to_thread(self._snapshot_facts, query, limit)
+        if facts is not None:
+            return facts
+
+        cache_key = ResultCache.key(query, limit, "fast")
+        cached, generation = await asyncio.to_thread(self._cached_result, cache_key)
+        if cached is not None:
+            return cached
+
+        facts = await self._graph_facts(keywords, limit)
+
+        await asyncio.to_thread(self.result_cache.put, cache_key, facts, generation)
+        return facts
+
+    def _snapshot_facts(self, query: str, limit: int) -> Tuple[List[str], List[str]]:
+        """
+        Entities of the query and, once the graph snapshot is loaded, its facts about
+        them (None otherwise). Run off the event loop: the gazetteer and the snapshot
+        check the SQLite generation when a refresh is due.
+        """
+        keywords = CognitiveMemory._query_entities(query, self.entities)
+        facts = self.graph.facts(keywords, limit) if self.graph is not None else None
+        return keywords, facts
+
+    def _graph_lookup(self, query: str) -> Tuple[List[str], List[Dict[str, Any]], List[str]]:
+        """
+        Entities of the query with the related entities and facts ranked in process,
+        see CognitiveMemory._graph_context. Run off the event loop like _snapshot_facts;
+        PageRank over a large snapshot can take a moment too.
+        """
+        keywords = CognitiveMemory._query_entities(query, self.entities)
+        related, facts = CognitiveMemory._graph_context(self.graph, keywords)
+        return keywords, related, facts
+
+    def _cached_result(self, cache_key: str) -> Tuple[Any, int]:
+        """
+        Cached result for `cache_key` (None on a miss) and the current write
+        generation, read before computing so a racing write invalidates the result.
+        Both may hit the generation's SQLite file.
+        """
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached, None
+        return None, self.result_cache.generation.current()
+
+    async def retrieve(self, query: str, top_k: int = 3) -> Dict[str, Any]:
+        """
+        Holographic retrieval, see CognitiveMemory.retrieve. The in-process graph
+        ranking does not depend on the query vector, so it runs concurrently with the
+        embedding call; everything else is one database round trip.
+        """
+        cache_key = ResultCache.key(query, top_k, "holographic")
+        cached, generation = await asyncio.to_thread(self._cached_result, cache_key)
+        if cached is not None:
+            return cached
+
+        query_vec, (keywords, related, facts) = await asyncio.gather(
+            self._embed(query), asyncio.to_thread(self._graph_lookup, query),
+        )
+        graph_query = (GRAPH_FACTS_SUBQUERY if facts is None else PROVIDED_FACTS_SUBQUERY) + GRAPH_MEMORIES_SUBQUERY
+        graph_params = {"keywords": keywords, "fact_limit": 5, "facts": facts, "related": related, "graph_k": 2 * top_k}
+
+        index_vec, fetch_k = query_vec, top_k
+        if self.full_vectors is not None:
+            index_vec, fetch_k = compact_vector(query_vec, COMPACT_DIMENSIONS), top_k * COMPACT_RERANK_FACTOR
+
+        mirrored = None
+        if self.vector_index is not None:
+            mirrored = await asyncio.to_thread(CognitiveMemory._mirror_search, self.vector_index, index_vec, fetch_k)
+        if mirrored is not None:
+            hits, summary_hits = mirrored
+            res = await self._query_neo4j(
+                MIRRORED_EPISODIC_SUBQUERY + MIRRORED_SUMMARY_SUBQUERY + graph_query + "RETURN episodic, summaries, facts, graph_hits",
+                {"k": fetch_k, "hits": hits, "summary_hits": summary_hits, **graph_params},
+                read_only=True,
+            )
+        else:
+            res = await self._query_neo4j(
+                EPISODIC_SUBQUERY + SUMMARY_SUBQUERY + graph_query + "RETURN episodic, summaries, facts, graph_hits",
+                {"k": fetch_k, "vec": index_vec, **graph_params},
+                read_only=True,
+            )
+        episodic, summaries, facts, graph_hits = res["results"][0]["data"][0]["row"]
+        if self.full_vectors is not None:
+            episodic = await asyncio.to_thread(rerank, query_vec, episodic, self.full_vectors, top_k)
+
+        results = CognitiveMemory._retrieval_results(episodic, summaries, facts, related, graph_hits, top_k)
+        await asyncio.to_thread(self.result_cache.put, cache_key, results, generation)
+        return results
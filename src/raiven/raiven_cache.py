@@ -0,0 +1,224 @@
+import os
+import sys
+import copy
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by (model, sha256(text)).
+    A bounded in-memory LRU sits in front of an optional SQLite file, so identical text
+    is embedded once, and vectors survive restarts and are shared between processes
+    (the MCP server and the metabolism worker) that point at the same file.
+    """
+    def __init__(self, max_entries: int = 4096, path: str = None):
+        self.max_entries = max(0, max_entries)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = self._open(os.path.expanduser(path))
+
+    @staticmethod
+    def _open(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            # WAL lets the MCP server read while the metabolism writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Warning: Embedding cache at {path} unavailable, using memory only: {e}", file=sys.stderr)
+            return None
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        key = self.key(model, text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    print(f"Warning: Embedding cache read failed: {e}", file=sys.stderr)
+                    row = None
+                if row is not None:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector.tolist()
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        key = self.key(model, text)
+        array = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, array)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                        (key, array.tobytes()),
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Warning: Embedding cache write failed: {e}", file=sys.stderr)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+class GenerationCounter:
+    """
+    Monotonic write generation used to invalidate cached retrieval results.
+    When a path is given the counter lives in a SQLite file, so a write in one process
+    (e.g. a RAPTOR summary from the metabolism) invalidates caches in the others;
+    otherwise it is local to the process.
+    """
+    def __init__(self, path: str = None):
+        self._value = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = self._open(os.path.expanduser(path))
+
+    @staticmethod
+    def _open(path: str) -> Optional[sqlite3.Connection]:
+        try:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, timeout=10, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (1, 0)")
+            db.commit()
+            return db
+        except Exception as e:
+            print(f"Warning: Shared generation counter at {path} unavailable, using process-local: {e}", file=sys.stderr)
+            return None
+
+    def current(self) -> int:
+        with self._lock:
+            if self._db is not None:
+                try:
+                    return self._db.execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+                except sqlite3.Error as e:
+                    print(f"Warning: Generation counter read failed: {e}", file=sys.stderr)
+            return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            if self._db is not None:
+                try:
+                    self._db.execute("UPDATE generation SET value = value + 1 WHERE id = 1")
+                    self._db.commit()
+                    return self._db.execute("SELECT value FROM generation WHERE id = 1").fetchone()[0]
+                except sqlite3.Error as e:
+                    print(f"Warning: Generation counter update failed: {e}", file=sys.stderr)
+            return self._value
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+class ResultCache:
+    """
+    Bounded cache of retrieval results with a TTL. Every entry remembers the write
+    generation it was computed at and is discarded as soon as the generation moves on.
+    """
+    def __init__(self, generation: GenerationCounter, max_entries: int = 256, ttl_seconds: float = 300):
+        self.generation = generation
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(query: str, top_k: int, mode: str) -> tuple:
+        # Only whitespace is normalised: keyword extraction is case sensitive
+        return (" ".join(query.split()), top_k, mode)
+
+    def get(self, key: tuple) -> Optional[Any]:
+        generation = self.generation.current()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_generation, expires_at = entry
+                if entry_generation == generation and time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, value: Any, generation: int):
+        """
+        Stores a result computed at `generation`, which the caller must read before
+        starting the computation so that concurrent writes invalidate it.
+        """
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(value), generation, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+from typing import List, Dict, Tuple, Optional
+
+# Nodes rewritten per transaction by the storage migration
+MIGRATION_BATCH_SIZE = 500
+
+def compact_vector(vector: List[float], dimensions: int) -> List[float]:
+    """
+    Keeps the leading `dimensions` components and renormalises them. Matryoshka-trained
+    embedding models (such as embeddinggemma) front-load the information, so the
+    prefix remains a good cosine-similarity embedding on its own.
+    """
+    prefix = np.asarray(vector[:dimensions], dtype=np.float32)
+    return (prefix / max(float(np.linalg.norm(prefix)), 1e-12)).tolist()
+
+class FullVectorStore:
+    """
+    Side store of full-precision embeddings keyed by node id, used in compact
+    storage mode to rerank the candidates found by the truncated vector index.
+    """
+    def __init__(self, path: str):
+        path = os.path.expanduser(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (id TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+
+    def put_many(self, items: List[Tuple[str, List[float]]]):
+        if not items:
+            return
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)",
+                [(node_id, np.asarray(vector, dtype=np.float32).tobytes()) for node_id, vector in items],
+            )
+            self._db.commit()
+
+    def get_many(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                for node_id, blob in self._db.execute(f"SELECT id, vector FROM vectors WHERE id IN ({placeholders})", batch):
+                    found[node_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def remove(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM vectors WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM vectors").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+def rerank(query_vec: List[float], hits: List[Dict], full_vectors: Optional[FullVectorStore], top_k: int) -> List[Dict]:
+    """
+    Re-scores over-fetched hits ({id, score, ...}) with their full-precision vectors
+    and keeps the best `top_k`. Hits without a stored full vector keep their index score.
+    Scores use the vector index convention (1 + cos) / 2.
+    """
+    if full_vectors is None or not hits:
+        return hits[:top_k]
+    full = full_vectors.get_many([h["id"] for h in hits])
+    query = np.asarray(query_vec, dtype=np.float32)
+    query /= max(float(np.linalg.norm(query)), 1e-12)
+    for hit in hits:
+        vector = full.get(hit["id"])
+        if vector is not None:
+            cosine = float(vector @ query) / max(float(np.linalg.norm(vector)), 1e-12)
+            hit["score"] = (1.0 + cosine) / 2.0
+    return sorted(hits, key=lambda h: h["score"], reverse=True)[:top_k]
+
+# --- Migration and report command ---
+
+def _vector_index_statements(dimensions: int, quantized: bool) -> List[str]:
+    options = f"`vector.dimensions`: {dimensions}, `vector.similarity_function`: 'cosine'"
+    if quantized:
+        options += ", `vector.quantization.enabled`: true"
+    return [
+        f"CREATE VECTOR INDEX {name} IF NOT EXISTS FOR (n:{label}) ON (n.embedding) OPTIONS {{indexConfig: {{{options}}}}}"
+        for name, label in (("chunk_embeddings", "Chunk"), ("summary_embeddings", "Summary"))
+    ]
+
+def recreate_vector_indexes(brain, dimensions: int, quantized: bool):
+    for name in ("chunk_embeddings", "summary_embeddings"):
+        brain._query_neo4j(f"DROP INDEX {name} IF EXISTS")
+    try:
+        for statement in _vector_index_statements(dimensions, quantized):
+            brain._query_neo4j(statement)
+    except Exception as e:
+        if not quantized:
+            raise
+        # Index quantization needs Neo4j 5.23+
+        print(f"Vector index quantization unavailable ({e}), creating float32 indexes", file=sys.stderr)
+        for statement in _vector_index_statements(dimensions, False):
+            brain._query_neo4j(statement)
+
+def migrate(brain, to_compact: bool):
+    """
+    Rewrites every stored embedding into the target layout and rebuilds the vector
+    indexes. compact: the full vector moves to the side store and the node keeps the
+    truncated float32 one. full: the side store's vectors are written back to the nodes;
+    nodes whose full vector is missing lose their compact one and are queued to be
+    embedded again (chunks) or resummarised (summaries). Nodes already in the target layout are skipped, so an interrupted run can be resumed.
+    """
+    from . import VECTOR_DIMENSIONS, COMPACT_DIMENSIONS, embedding_assignment
+    if to_compact and brain.full_vectors is None:
+        raise SystemExit("Set RAIVEN_EMBEDDING_STORAGE=compact to migrate to the compact layout.")
+    store = brain.full_vectors or FullVectorStore(_side_store_path())
+    source, target = (VECTOR_DIMENSIONS, COMPACT_DIMENSIONS) if to_compact else (COMPACT_DIMENSIONS, VECTOR_DIMENSIONS)
+
+    # Dropped first so the rewrite does not churn an index of the old size
+    for name in ("chunk_embeddings", "summary_embeddings"):
+        brain._query_neo4j(f"DROP INDEX {name} IF EXISTS")
+
+    for label in ("Chunk", "Summary"):
+        cursor, moved, missing = "", 0, 0
+        while True:
+            result = brain._query_neo4j(f"""
+                MATCH (n:{label})
+                WHERE n.id > $cursor AND n.embedding IS NOT NULL
+                RETURN n.id, n.embedding
+                ORDER BY n.id
+                LIMIT $batch
+            """, {"cursor": cursor, "batch": MIGRATION_BATCH_SIZE}, read_only=True)
+            rows = [r["row"] for r in result["results"][0]["data"]]
+            if not rows:
+                break
+            cursor = rows[-1][0]
+            pending = [(node_id, vector) for node_id, vector in rows if len(vector) == source]
+            if to_compact:
+                store.put_many(pending)
+                updates = [{"id": node_id, "emb": compact_vector(vector, target)} for node_id, vector in pending]
+            else:
+                full = store.get_many([node_id for node_id, _ in pending])
+                lost = [node_id for node_id, _ in pending if node_id not in full]
+                if lost:
+                    # A compact vector would sit unsearchable next to the full-size index
+                    brain._query_neo4j(f"""
+                        UNWIND $ids AS nid
+                        MATCH (n:{label} {{id: nid}})
+                        SET n.embedding = null,
+                    """ + ("n.needs_embedding = true, n.failed_attempts = 0" if label == "Chunk" else "n.dirty = true"),
+                        {"ids": lost})
+                missing += len(lost)
+                updates = [{"id": node_id, "emb": vector.tolist()} for node_id, vector in full.items()]
+            if updates:
+                brain._query_neo4j(f"""
+                    UNWIND $rows AS row
+                    MATCH (n:{label} {{id: row.id}})
+                """ + (embedding_assignment("n", "row.emb") if to_compact else "SET n.embedding = row.emb"),
+                    {"rows": updates})
+            moved += len(updates)
+        print(f">> {label}: rewrote {moved} embeddings" + (f", {missing} without a full vector queued to be recomputed" if missing else ""), file=sys.stderr)
+
+    if store is not brain.full_vectors:
+        store.close()
+    recreate_vector_indexes(brain, target, quantized=to_compact)
+    brain.result_cache.generation.bump()
+    print(">> Vector indexes rebuilt; Neo4j populates them in the background.", file=sys.stderr)
+
+def _side_store_path() -> str:
+    from . import FULL_VECTOR_STORE_PATH
+    return FULL_VECTOR_STORE_PATH
+
+def _full_vectors(brain) -> Tuple[List[str], np.ndarray]:
+    """
+    All full-precision chunk vectors: from the side store in compact mode, from the
+    nodes otherwise.
+    """
+    from . import VECTOR_DIMENSIONS
+    ids, vectors, cursor = [], [], ""
+    while True:
+        result = brain._query_neo4j("""
+            MATCH (c:Chunk)
+            WHERE c.id > $cursor AND c.embedding IS NOT NULL
+            RETURN c.id, CASE WHEN $with_vectors THEN c.embedding ELSE null END
+            ORDER BY c.id
+            LIMIT $batch
+        """, {"cursor": cursor, "batch": MIGRATION_BATCH_SIZE, "with_vectors": brain.full_vectors is None}, read_only=True)
+        rows = [r["row"] for r in result["results"][0]["data"]]
+        if not rows:
+            break
+        cursor = rows[-1][0]
+        if brain.full_vectors is not None:
+            full = brain.full_vectors.get_many([node_id for node_id, _ in rows])
+            rows = [(node_id, full[node_id]) for node_id, _ in rows if node_id in full]
+        for node_id, vector in rows:
+            if vector is not None and len(vector) == VECTOR_DIMENSIONS:
+                ids.append(node_id)
+                vectors.append(np.asarray(vector, dtype=np.float32))
+    if not vectors:
+        return [], np.zeros((0, VECTOR_DIMENSIONS), dtype=np.float32)
+    matrix = np.stack(vectors)
+    return ids, matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+def report(brain, queries: int = 100, k: int = 10) -> Dict:
+    """
+    Recall@k and latency of the configured vector search against exact search over
+    the full-precision vectors, using stored chunks as queries. Run it before and
+    after migrating to compare the layouts.
+    """
+    from . import EMBEDDING_STORAGE, VECTOR_DIMENSIONS, COMPACT_DIMENSIONS
+    ids, matrix = _full_vectors(brain)
+    if len(ids) <= k:
+        raise SystemExit(f"Need more than {k} embedded chunks for a report, found {len(ids)}.")
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(ids), size=min(queries, len(ids)), replace=False)
+    recalls, latencies = [], []
+    for row in sample:
+        scores = matrix @ matrix[row]
+        scores[row] = -np.inf # The query chunk itself is not a result
+        exact = {ids[i] for i in np.argpartition(-scores, k - 1)[:k]}
+
+        started = time.perf_counter()
+        found = [hit["id"] for hit in brain.vector_search(matrix[row].tolist(), k + 1)]
+        latencies.append(time.perf_counter() - started)
+        found = [node_id for node_id in found if node_id != ids[row]][:k]
+        recalls.append(len(exact.intersection(found)) / k)
+
+    compact = EMBEDDING_STORAGE == "compact"
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "storage": EMBEDDING_STORAGE,
+        "index_dimensions": COMPACT_DIMENSIONS if compact else VECTOR_DIMENSIONS,
+        # Float lists set from Cypher are stored as float64, vector properties as float32
+        "bytes_per_node_vector": COMPACT_DIMENSIONS * 4 if compact else VECTOR_DIMENSIONS * 8,
+        "chunks": len(ids),
+        "queries": len(sample),
+        f"recall_at_{k}": float(np.mean(recalls)),
+        "latency_ms_mean": float(latencies_ms.mean()),
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)),
+    }
+
+def main():
+    from . import CognitiveMemory
+    parser = argparse.ArgumentParser(description="Compact embedding storage: migration and recall/latency report.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Move stored embeddings to the layout set by RAIVEN_EMBEDDING_STORAGE.")
+    benchmark = commands.add_parser("report", help="Compare the configured vector search with exact search.")
+    benchmark.add_argument("--queries", type=int, default=100)
+    benchmark.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    brain = CognitiveMemory()
+    try:
+        if args.command == "migrate":
+            migrate(brain, to_compact=brain.full_vectors is not None)
+        else:
+            print(json.dumps(report(brain, queries=args.queries, k=args.k), indent=2))
+    finally:
+        brain.close()
+
+if __name__ == "__main__":
+    main()
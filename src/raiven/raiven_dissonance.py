@@ -0,0 +1,120 @@
+import re
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+# Skip reasons recorded on chunks that never reach the LLM
+SKIP_NO_NEIGHBOURS = "no_neighbours"
+SKIP_UNRELATED = "unrelated"
+SKIP_NEAR_DUPLICATE = "near_duplicate"
+SKIP_DUPLICATE = "duplicate"
+SKIP_NO_SHARED_ENTITIES = "no_shared_entities"
+# Recorded once the LLM has left a chunk unanswered too many times
+SKIP_UNANSWERED = "unanswered"
+
+def _normalise(text: str) -> str:
+    # Case, punctuation and spacing only: "3.10" and "3.12" or a "not" still differ
+    return re.sub(r"\W+", " ", text.casefold()).strip()
+
+def triage(text: str, embedding: List[float], entities: List[str], neighbours: List[Dict[str, Any]],
+           min_similarity: float, max_similarity: float) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Keeps the neighbours worth an LLM comparison: not the same text, same topic
+    (cosine similarity of at least min_similarity) and, when both sides mention
+    entities, at least one entity in common. Pairs at or above max_similarity are
+    treated as restatements, unless it is 1.0 or more (disabled): a one-token
+    contradiction embeds almost like the original, so a lower bound trades those
+    away for fewer LLM calls. Returns (candidates, skip_reason); the reason is that
+    of the closest neighbour and is None when there are candidates.
+    """
+    if not neighbours:
+        return [], SKIP_NO_NEIGHBOURS
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    matrix = np.asarray([n["embedding"] for n in neighbours], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    similarities = matrix @ vector / np.maximum(norms, 1e-12)
+
+    own = set(entities or [])
+    normalised = _normalise(text)
+    candidates, reasons = [], []
+    for neighbour, similarity in zip(neighbours, similarities):
+        if _normalise(neighbour["text"] or "") == normalised:
+            reasons.append(SKIP_DUPLICATE)
+        elif similarity < min_similarity:
+            reasons.append(SKIP_UNRELATED)
+        elif max_similarity < 1.0 and similarity >= max_similarity:
+            reasons.append(SKIP_NEAR_DUPLICATE)
+        elif own and neighbour["entities"] and not own.intersection(neighbour["entities"]):
+            reasons.append(SKIP_NO_SHARED_ENTITIES)
+        else:
+            candidates.append(neighbour)
+    return candidates, (None if candidates else reasons[0])
+
+def build_prompt(items: List[Tuple[str, str]]) -> str:
+    """
+    One prompt for several (existing_knowledge, new_information) pairs. A single pair
+    keeps the original free-form question.
+    """
+    if len(items) == 1:
+        existing_knowledge, text = items[0]
+        return f"""
+        Analyze the following NEW information against the EXISTING knowledge.
+        Identify if there are direct contradictions or significant inconsistencies.
+
+        EXISTING KNOWLEDGE:
+        {existing_knowledge}
+
+        NEW INFORMATION:
+        {text}
+
+        If there is a contradiction, explain it briefly. If they are consistent, reply 'CONSISTENT'.
+        """
+
+    sections = "\n".join(
+        f"""
+        [{number}]
+        EXISTING KNOWLEDGE:
+        {existing_knowledge}
+
+        NEW INFORMATION:
+        {text}
+        """
+        for number, (existing_knowledge, text) in enumerate(items, start=1)
+    )
+    return f"""
+        For each numbered item below, analyze the NEW information against the EXISTING knowledge.
+        Identify if there are direct contradictions or significant inconsistencies.
+        {sections}
+        Answer with exactly one line per item, starting with its number:
+        "<number>: CONSISTENT" if they are consistent, otherwise "<number>: " followed by a brief explanation of the contradiction.
+        """
+
+# "2: ...", "2) ...", "[2] ..." or "[2]: ..."
+_ANSWER = re.compile(r"^\s*(?:\[(\d+)\]\s*[:.\-]?|(\d+)\s*[:.)\-])\s*(.*)$")
+
+def parse_verdicts(analysis: str, count: int) -> Dict[int, Optional[str]]:
+    """
+    Maps item index (0-based) to None when consistent or to the contradiction report.
+    Items the model did not answer are missing, so they can be checked again later.
+    """
+    if not analysis.strip():
+        return {}
+    if count == 1:
+        return {0: None if "CONSISTENT" in analysis.upper() else analysis}
+
+    answers: Dict[int, str] = {}
+    current = None
+    for line in analysis.splitlines():
+        match = _ANSWER.match(line)
+        number = match and int(match.group(1) or match.group(2))
+        if number and 1 <= number <= count:
+            current = number - 1
+            answers[current] = match.group(3).strip()
+        elif current is not None and line.strip():
+            # Explanation continued on the next line
+            answers[current] += " " + line.strip()
+    return {
+        index: None if answer.upper().startswith("CONSISTENT") else answer
+        for index, answer in answers.items()
+        if answer
+    }
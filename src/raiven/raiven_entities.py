@@ -0,0 +1,202 @@
+import re
+import sys
+import time
+import threading
+from typing import List, Dict, Set, Tuple, Callable, Iterable, Optional
+
+# Words, keeping internal punctuation: "Node.js", "C++", "O'Brien", "GPT-4"
+_TOKEN = re.compile(r"\w+(?:[.'’&+\-]\w+)*\+*")
+
+# Capitalised function words that start sentences; never entities on their own
+STOPWORDS = frozenset("""
+    a an and are as at be but by can could did do does for from had has have he her his how
+    i if in into is it its let may me might my no not of on or our she should so that the
+    their them then there these they this those to was we were what when where which who
+    why will with would yes you your
+""".split())
+
+# Terminal marker in the trie; tokens are always non-empty strings
+_NAMES = ""
+
+# Delay before retrying a failed first load, doubled after each failure up to the
+# refresh interval
+RETRY_SECONDS = 5
+
+def _key(token: str) -> str:
+    # "Omega's" is looked up as "omega"
+    token = token.casefold()
+    return token[:-2] if token.endswith(("'s", "’s")) and len(token) > 2 else token
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """
+    (token, start, end) for every word of `text`.
+    """
+    return [(m.group(), m.start(), m.end()) for m in _TOKEN.finditer(text)]
+
+def heuristic_entities(text: str) -> List[str]:
+    """
+    Capitalised words, stripped of trailing punctuation, that are not stopwords.
+    """
+    words = (word.strip(".,!?") for word in text.split())
+    return [w for w in words if len(w) > 1 and w[0].isupper() and w.casefold() not in STOPWORDS]
+
+class EntityGazetteer:
+    """
+    In-process index of the known Entity names: a trie over case-folded tokens,
+    matched against a text in a single left-to-right pass (longest name first), so
+    multi-word names are found without an LLM call and lookups only carry names that
+    exist in the graph.
+
+    The names are loaded by `fetch` in a background thread, kept current by `add`
+    after each ingestion and reloaded every `refresh_seconds` once `generation`
+    (the cross-process write counter) has moved, which picks up other processes'
+    entities and drops pruned ones. Until the first load completes `ready` is False
+    and callers fall back to the heuristic; a failed first load is retried with
+    backoff.
+    """
+    def __init__(self, fetch: Callable[[], Iterable[str]], refresh_seconds: float = 600,
+                 generation: Optional[Callable[[], int]] = None):
+        self._fetch = fetch
+        self._generation = generation
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._root: Dict = {}
+        self._size = 0
+        self._loaded_at = None
+        self._loaded_generation = None
+        self._retry_delay = RETRY_SECONDS
+        self._retry_at = None
+        # Names added while a reload is running, replayed on the new trie
+        self._pending: Optional[List[str]] = None
+        self.reload()
+
+    @property
+    def ready(self) -> bool:
+        return self._loaded_at is not None
+
+    def __len__(self) -> int:
+        return self._size
+
+    @staticmethod
+    def _insert(root: Dict, name: str) -> bool:
+        tokens = [_key(token) for token, _, _ in tokenize(name)]
+        if not tokens or (len(tokens) == 1 and (tokens[0] in STOPWORDS or len(tokens[0]) < 2)):
+            return False
+        node = root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        names = node.setdefault(_NAMES, set())
+        if name in names:
+            return False
+        names.add(name)
+        return True
+
+    def add(self, names: Iterable[str]):
+        """
+        Registers names just merged into the graph.
+        """
+        with self._lock:
+            for name in names:
+                if self._insert(self._root, name):
+                    self._size += 1
+                if self._pending is not None:
+                    self._pending.append(name)
+
+    def reload(self):
+        """
+        Rebuilds the trie from `fetch` in a background thread; matching keeps using
+        the current one meanwhile.
+        """
+        with self._lock:
+            if self._pending is not None:
+                return
+            self._pending = []
+        threading.Thread(target=self._reload, name="entity-gazetteer", daemon=True).start()
+
+    def _reload(self):
+        try:
+            generation = self._generation() if self._generation else None
+            root, size = {}, 0
+            for name in self._fetch():
+                size += self._insert(root, name)
+        except Exception as e:
+            print(f"Warning: Could not load the entity gazetteer: {e}", file=sys.stderr)
+            with self._lock:
+                self._pending = None
+                if self._loaded_at is not None:
+                    # Retry at the next refresh
+                    self._loaded_at = time.monotonic()
+                else:
+                    self._retry_at = time.monotonic() + self._retry_delay
+                    self._retry_delay = min(2 * self._retry_delay, self.refresh_seconds)
+            return
+        with self._lock:
+            for name in self._pending:
+                size += self._insert(root, name)
+            self._root, self._size = root, size
+            self._pending = None
+            self._loaded_at = time.monotonic()
+            self._loaded_generation = generation
+            self._retry_at = None
+
+    def _refresh_if_due(self):
+        if self._loaded_at is None:
+            if self._retry_at is not None and time.monotonic() >= self._retry_at:
+                self._retry_at = None
+                self.reload()
+            return
+        if time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        if self._generation is not None and self._generation() == self._loaded_generation:
+            # Nothing written anywhere since the last load
+            self._loaded_at = time.monotonic()
+            return
+        self.reload()
+
+    def match(self, text: str) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """
+        Known entity names mentioned in `text` and the character spans they cover.
+        Case is ignored, except that a lowercase word only matches single-word names
+        stored in lowercase ("may" is not "May").
+        """
+        self._refresh_if_due()
+        root = self._root
+        tokens = tokenize(text)
+        found: Dict[str, None] = {}
+        spans = []
+        i = 0
+        while i < len(tokens):
+            node, end, names = root, None, None
+            for j in range(i, len(tokens)):
+                node = node.get(_key(tokens[j][0]))
+                if node is None:
+                    break
+                if _NAMES in node:
+                    end, names = j, node[_NAMES]
+            if names is not None and end == i and tokens[i][0].islower():
+                names = [n for n in names if n.islower()]
+            if names:
+                found.update(dict.fromkeys(sorted(names)))
+                spans.append((tokens[i][1], tokens[end][2]))
+                i = end + 1
+            else:
+                i += 1
+        return list(found), spans
+
+    def known(self, text: str) -> List[str]:
+        """
+        Entity names of the graph mentioned in `text`, for lookups.
+        """
+        return self.match(text)[0]
+
+    def extract(self, text: str) -> List[str]:
+        """
+        Entities of a new memory: the known names it mentions plus, for new entities,
+        the heuristic's capitalised words outside those names.
+        """
+        names, spans = self.match(text)
+        covered: Set[str] = set()
+        for start, end in spans:
+            covered.update(_key(token) for token, _, _ in tokenize(text[start:end]))
+        fresh = [w for w in heuristic_entities(text) if _key(w) not in covered]
+        return names + fresh
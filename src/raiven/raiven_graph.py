@@ -0,0 +1,297 @@
+import sys
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import List, Dict, Tuple, Callable, Iterable, Optional
+
+# Entity edges: (source name, target name, weight, updated_at in epoch milliseconds)
+Edge = Tuple[str, str, float, int]
+
+# Edges written by transactions that were still open during a refresh carry an earlier
+# timestamp than the ones already seen, so each delta re-reads this window
+CHANGE_FEED_OVERLAP_MS = 60_000
+
+# Two-hop facts rank below direct ones of the same strength
+SECOND_HOP_FACTOR = 0.5
+
+# Personalised PageRank: probability of jumping back to the seeds at each step, and the
+# L1 change at which the power iteration stops
+PPR_RESTART = 0.15
+PPR_TOLERANCE = 1e-6
+PPR_MAX_ITERATIONS = 100
+
+class _Snapshot:
+    """
+    Immutable adjacency of the RELATED_TO graph. Directed edges are kept as parallel
+    arrays (to merge deltas) and, symmetrised like the undirected Cypher lookup, in
+    CSR form with every row sorted by descending weight.
+    """
+    def __init__(self, names: List[str], src: np.ndarray, dst: np.ndarray, weight: np.ndarray):
+        self.names = names
+        self.index = {name: i for i, name in enumerate(names)}
+        self.src, self.dst, self.weight = src, dst, weight
+
+        n = len(names)
+        rows = np.concatenate([src, dst])
+        cols = np.concatenate([dst, src])
+        weights = np.concatenate([weight, weight])
+        # Both directions of a pair collapse into the strongest one
+        order = np.lexsort((-weights, cols, rows))
+        rows, cols, weights = rows[order], cols[order], weights[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+        rows, cols, weights = rows[first], cols[first], weights[first]
+        order = np.lexsort((-weights, rows))
+        self.neighbours = cols[order].astype(np.int32)
+        self.neighbour_weights = weights[order].astype(np.float32)
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.indptr[1:])
+
+    @classmethod
+    def build(cls, edges: Iterable[Edge], base: "_Snapshot" = None) -> Tuple["_Snapshot", int]:
+        """
+        New snapshot from `base` (if any) with `edges` inserted or updated.
+        Returns it with the newest updated_at among the edges.
+        """
+        names = list(base.names) if base else []
+        index = dict(base.index) if base else {}
+        src, dst, weight, newest = [], [], [], 0
+        for source, target, w, updated_at in edges:
+            for name in (source, target):
+                if name not in index:
+                    index[name] = len(names)
+                    names.append(name)
+            src.append(index[source])
+            dst.append(index[target])
+            weight.append(w)
+            newest = max(newest, updated_at or 0)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        weight = np.asarray(weight, dtype=np.float32)
+        if base is not None:
+            # Later entries win: keep the last occurrence of every (source, target)
+            src = np.concatenate([base.src, src])
+            dst = np.concatenate([base.dst, dst])
+            weight = np.concatenate([base.weight, weight])
+            keys = src * max(len(names), 1) + dst
+            _, last = np.unique(keys[::-1], return_index=True)
+            keep = np.sort(len(keys) - 1 - last)
+            src, dst, weight = src[keep], dst[keep], weight[keep]
+        return cls(names, src, dst, weight), newest
+
+    def row(self, node: int) -> Tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.indptr[node], self.indptr[node + 1]
+        return self.neighbours[lo:hi], self.neighbour_weights[lo:hi]
+
+    def _transitions(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Random-walk matrix in COO form: (source row of every CSR entry, probability of
+        following it, mask of the nodes without edges). Built on first use.
+        """
+        if not hasattr(self, "_walk"):
+            degrees = np.diff(self.indptr)
+            rows = np.repeat(np.arange(len(self.names)), degrees)
+            totals = np.bincount(rows, weights=self.neighbour_weights, minlength=len(self.names))
+            probabilities = self.neighbour_weights / np.maximum(totals[rows], 1e-12)
+            self._walk = (rows, probabilities, totals <= 0)
+        return self._walk
+
+    def personalized_pagerank(self, seeds: List[int]) -> np.ndarray:
+        """
+        Stationary distribution of a weighted random walk that restarts at the seeds
+        with probability PPR_RESTART, by vectorised power iteration. Walks reaching a
+        node without edges restart too.
+        """
+        n = len(self.names)
+        restart = np.zeros(n)
+        restart[seeds] = 1.0 / len(seeds)
+        rows, probabilities, dangling = self._transitions()
+        rank = restart.copy()
+        for _ in range(PPR_MAX_ITERATIONS):
+            spread = np.bincount(self.neighbours, weights=rank[rows] * probabilities, minlength=n)
+            spread += rank[dangling].sum() * restart
+            updated = PPR_RESTART * restart + (1.0 - PPR_RESTART) * spread
+            converged = np.abs(updated - rank).sum() < PPR_TOLERANCE
+            rank = updated
+            if converged:
+                break
+        return rank.astype(np.float32)
+
+class EntityGraph:
+    """
+    In-process snapshot of the weighted entity graph answering fast-mode lookups
+    without a database round trip.
+
+    `load_all` yields every edge and `load_since(ms)` the edges written since then
+    (r.updated_at, the change feed). The first lookup starts the load in a background
+    thread and returns None until it completes, so callers query Neo4j meanwhile.
+    After writes (a new `generation`) a delta is applied at most every
+    `refresh_seconds`. The change feed cannot show deletions: when `count_edges`
+    reports fewer edges than the updated snapshot holds, it is rebuilt in full at
+    once; otherwise deleted edges disappear at the rebuild done every `rebuild_seconds`.
+    """
+    def __init__(self, load_all: Callable[[], Iterable[Edge]], load_since: Callable[[int], Iterable[Edge]],
+                 refresh_seconds: float = 5, rebuild_seconds: float = 3600,
+                 generation: Optional[Callable[[], int]] = None, ppr_cache_size: int = 256,
+                 count_edges: Optional[Callable[[], int]] = None):
+        self._load_all = load_all
+        self._load_since = load_since
+        self._count_edges = count_edges
+        self._generation = generation
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._loading = False
+        self._snapshot: Optional[_Snapshot] = None
+        self._newest = 0
+        self._seen_generation = None
+        self._refreshed_at = 0.0
+        self._rebuilt_at = 0.0
+        # Stationary vectors of recent seed sets, valid for one snapshot
+        self.ppr_cache_size = ppr_cache_size
+        self._ppr_cache: "OrderedDict[Tuple[int, ...], np.ndarray]" = OrderedDict()
+        self._ppr_snapshot = None
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def _start(self, full: bool):
+        with self._lock:
+            if self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._refresh, args=(full,), name="entity-graph", daemon=True).start()
+
+    def _refresh(self, full: bool):
+        try:
+            generation = self._generation() if self._generation else None
+            started = time.monotonic()
+            if full or self._snapshot is None:
+                snapshot, newest = _Snapshot.build(self._load_all())
+                self._rebuilt_at = started
+            else:
+                snapshot, newest = _Snapshot.build(self._load_since(self._newest - CHANGE_FEED_OVERLAP_MS), base=self._snapshot)
+                newest = max(newest, self._newest)
+                # Counted after the delta: edges added meanwhile can only postpone the
+                # detection to the next delta, never trigger a needless rebuild
+                expected = self._count_edges() if self._count_edges else None
+                if expected is not None and len(snapshot.src) > expected:
+                    # Edges were deleted (pruned or forgotten): start over
+                    snapshot, newest = _Snapshot.build(self._load_all())
+                    self._rebuilt_at = started
+            self._snapshot, self._newest = snapshot, newest
+            self._seen_generation = generation
+        except Exception as e:
+            print(f"Warning: Could not refresh the entity graph cache: {e}", file=sys.stderr)
+        finally:
+            self._refreshed_at = time.monotonic()
+            with self._lock:
+                self._loading = False
+
+    def _refresh_if_due(self):
+        now = time.monotonic()
+        if self._snapshot is None:
+            self._start(full=True)
+        elif now - self._rebuilt_at >= self.rebuild_seconds:
+            self._start(full=True)
+        elif now - self._refreshed_at >= self.refresh_seconds:
+            if self._generation is None or self._generation() != self._seen_generation:
+                self._start(full=False)
+            else:
+                self._refreshed_at = now
+
+    def related(self, names: List[str], limit: int = 10, hops: int = 2) -> Optional[List[Tuple[str, str, float]]]:
+        """
+        Strongest facts around the given entities as (entity, neighbour, score), best
+        first. Direct edges score their weight; second-hop edges the weaker of the two
+        edges on the path, scaled by SECOND_HOP_FACTOR. None while the snapshot loads.
+        """
+        self._refresh_if_due()
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        seeds = [snapshot.index[n] for n in dict.fromkeys(names) if n in snapshot.index]
+        best: Dict[Tuple[int, int], Tuple[float, int, int]] = {}
+
+        def offer(a: int, b: int, score: float):
+            key = (a, b) if a < b else (b, a)
+            if key not in best or best[key][0] < score:
+                best[key] = (score, a, b)
+
+        for seed in seeds:
+            neighbours, weights = snapshot.row(seed)
+            # Rows are sorted by weight, so the first `limit` entries are the strongest
+            for neighbour, weight in zip(neighbours[:limit].tolist(), weights[:limit].tolist()):
+                offer(seed, neighbour, weight)
+                if hops < 2:
+                    continue
+                second, second_weights = snapshot.row(neighbour)
+                for target, target_weight in zip(second[:limit].tolist(), second_weights[:limit].tolist()):
+                    if target != seed:
+                        offer(neighbour, target, SECOND_HOP_FACTOR * min(weight, target_weight))
+
+        ranked = sorted(best.values(), reverse=True)[:limit]
+        return [(snapshot.names[a], snapshot.names[b], score) for score, a, b in ranked]
+
+    def _pagerank(self, snapshot: _Snapshot, seeds: Tuple[int, ...]) -> np.ndarray:
+        with self._lock:
+            if self._ppr_snapshot is not snapshot:
+                self._ppr_cache.clear()
+                self._ppr_snapshot = snapshot
+            rank = self._ppr_cache.get(seeds)
+            if rank is not None:
+                self._ppr_cache.move_to_end(seeds)
+                return rank
+        rank = snapshot.personalized_pagerank(list(seeds))
+        with self._lock:
+            if self._ppr_snapshot is snapshot and self.ppr_cache_size > 0:
+                self._ppr_cache[seeds] = rank
+                while len(self._ppr_cache) > self.ppr_cache_size:
+                    self._ppr_cache.popitem(last=False)
+        return rank
+
+    def related_entities(self, names: List[str], limit: int = 10) -> Optional[List[Tuple[str, float]]]:
+        """
+        Entities most relevant to the given ones across any number of hops: the top
+        of their personalised PageRank, seeds excluded, as (name, score) best first.
+        None while the snapshot loads.
+        """
+        self._refresh_if_due()
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        seeds = tuple(sorted({snapshot.index[n] for n in names if n in snapshot.index}))
+        if not seeds:
+            return []
+        rank = self._pagerank(snapshot, seeds).copy()
+        rank[list(seeds)] = 0.0
+        count = min(limit, int(np.count_nonzero(rank)))
+        if count == 0:
+            return []
+        top = np.argpartition(-rank, count - 1)[:count]
+        top = top[np.argsort(-rank[top])]
+        return [(snapshot.names[i], float(rank[i])) for i in top]
+
+    def facts(self, names: List[str], limit: int = 10) -> Optional[List[str]]:
+        """
+        related() phrased like the Cypher graph facts.
+        """
+        related = self.related(names, limit)
+        if related is None:
+            return None
+        return [f"{a} is related to {b}" for a, b, _ in related]
+
+    def stats(self) -> Dict:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "entities": len(snapshot.names),
+            "edges": int(len(snapshot.src)),
+            "bytes": int(sum(a.nbytes for a in (snapshot.src, snapshot.dst, snapshot.weight,
+                                                 snapshot.neighbours, snapshot.neighbour_weights, snapshot.indptr))),
+        }
@@ -4,6 +4,9 @@ import logging
 import subprocess
 import json
 import uuid
+import asyncio
+import inspect
+import threading
 
 # Configure logging to stderr
 logging.basicConfig(level=logging.DEBUG, stream=sys.stderr)
@@ -18,48 +21,101 @@ recording_session_name = None
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from mcp.server.fastmcp import FastMCP
-from raiven import CognitiveMemory
+from raiven import CognitiveMemory, SESSION_LOG_FLUSH_SECONDS, SESSION_LOG_BATCH, SESSION_PAGE_SIZE, METABOLISM_POLL_SECONDS
+from raiven.raiven_async import AsyncCognitiveMemory
+from raiven.raiven_session_log import SessionLogBuffer
 
 # Initialize FastMCP server
 mcp = FastMCP("Raiven Memory System")
 
 # Initialize the memory core
 brain = None
+async_brain = None
+_brain_lock = threading.Lock()
+session_log = None
+_session_log_lock = threading.Lock()
 
 def get_brain():
     global brain
-    if brain is None:
-        logger.debug("Initializing CognitiveMemory core...")
-        try:
-            brain = CognitiveMemory()
-            logger.debug("CognitiveMemory core initialized successfully.")
-        except Exception as e:
-            import traceback
-            traceback.print_exc(file=sys.stderr)
-            raise
+    # Tools run in worker threads, so initialization must happen only once
+    with _brain_lock:
+        if brain is None:
+            logger.debug("Initializing CognitiveMemory core...")
+            try:
+                brain = CognitiveMemory()
+                logger.debug("CognitiveMemory core initialized successfully.")
+            except Exception as e:
+                import traceback
+                traceback.print_exc(file=sys.stderr)
+                raise
     return brain
 
+async def get_async_brain():
+    """
+    Returns the asyncio memory core used by the interactive tools. It shares the
+    caches of the synchronous core, so writes through either invalidate both.
+    """
+    global async_brain
+    if async_brain is None:
+        # Schema initialization is blocking, keep it off the event loop
+        sync_brain = await asyncio.to_thread(get_brain)
+        if async_brain is None:
+            async_brain = AsyncCognitiveMemory(
+                database=sync_brain.database,
+                embedding_cache=sync_brain.embedding_cache,
+                result_cache=sync_brain.result_cache,
+                vector_index=sync_brain.vector_index,
+                full_vectors=sync_brain.full_vectors,
+                entities=sync_brain.entities,
+                graph=sync_brain.graph,
+            )
+    return async_brain
+
+def get_session_log():
+    """
+    Returns the write-behind buffer of recorded messages, or None when
+    RAIVEN_SESSION_LOG_FLUSH_SECONDS=0 asks for immediate writes.
+    """
+    global session_log
+    with _session_log_lock:
+        if session_log is None and SESSION_LOG_FLUSH_SECONDS > 0:
+            session_log = SessionLogBuffer(
+                lambda sid, name, messages: get_brain().log_session_messages(sid, name, messages),
+                flush_seconds=SESSION_LOG_FLUSH_SECONDS,
+                max_batch=SESSION_LOG_BATCH,
+            )
+    return session_log
+
+async def flush_session_log():
+    """
+    Writes the buffered messages, so the logs read next are complete.
+    """
+    if session_log is not None:
+        await asyncio.to_thread(session_log.flush)
+
 @mcp.tool()
-def check_metabolism() -> str:
+async def check_metabolism() -> str:
     """
     Checks if the Subconscious Metabolism process is running in the server.
     """
     logger.debug("Tool check_metabolism called")
     try:
-        brain = get_brain()
+        brain = await get_async_brain()
         # Query the dedicated heartbeat node
-        result = brain._query_neo4j("""
+        result = await brain._query_neo4j("""
             MATCH (h:Heartbeat {id: 'metabolism'})
             RETURN h.last_seen as last_seen, 
                    duration.between(datetime(h.last_seen), datetime()).seconds as seconds_ago
-        """)
+        """, read_only=True)
         
         if result and "results" in result and result["results"] and result["results"][0]["data"]:
             data = result["results"][0]["data"][0]["row"]
             last_seen = data[0]
             seconds_ago = data[1]
             
-            if seconds_ago < 300: # Active if seen in the last 5 minutes
+            # An idle event-driven worker only reports in every METABOLISM_POLL_SECONDS
+            stall_seconds = max(300, 2 * METABOLISM_POLL_SECONDS)
+            if seconds_ago < stall_seconds:
                 return f"Subconscious Metabolism is ACTIVE in the server. Last heartbeat: {last_seen} ({seconds_ago} seconds ago)."
             else:
                 return f"Subconscious Metabolism STALLED: Last heartbeat was {seconds_ago} seconds ago ({last_seen}). Please check systemd service 'raiven-metabolism'."
@@ -83,7 +139,7 @@ def start_recording(session_name: str) -> str:
     return f"Recording started for session: '{session_name}' (ID: {recording_session_id}). All subsequent messages will be archived."
 
 @mcp.tool()
-def stop_recording(summary: str) -> str:
+async def stop_recording(summary: str) -> str:
     """
     Stops the current conversation recording and adds a summary to vectorized memory.
     
@@ -95,29 +151,31 @@ def stop_recording(summary: str) -> str:
         return "No active recording session found."
     
     try:
-        brain = get_brain()
+        brain = await get_async_brain()
+        # The summary is linked to every logged message, including the buffered ones
+        await flush_session_log()
         # 1. Add the summary as a normal memory chunk (vectorized)
         # We include the session name and ID to contextualize the search hit later
         full_summary_text = f"SESSION SUMMARY ({recording_session_name}): {summary}"
-        brain.add_memory(
+        chunk_id = await brain.add_memory(
             text=full_summary_text,
             role="assistant",
             entities=["Session Summary", recording_session_name]
         )
         
         # 2. Link this summary to the Session node and its messages
-        # We find the newly created chunk (highest timestamp/uuid) and link it
+        # The new chunk is looked up by id (unique constraint) rather than by its text
         cypher = """
         MATCH (s:Session {id: $sid})
-        MATCH (c:Chunk) WHERE c.text = $stext
+        MATCH (c:Chunk {id: $cid})
         MERGE (s)-[:SUMMARIZED_BY]->(c)
         WITH s, c
         MATCH (s)-[:HAS_MESSAGE]->(m:MessageLog)
         MERGE (c)-[:SUMMARIZES_LOG]->(m)
         """
-        brain._query_neo4j(cypher, {
+        await brain._query_neo4j(cypher, {
             "sid": recording_session_id,
-            "stext": full_summary_text
+            "cid": chunk_id
         })
         
         old_name = recording_session_name
@@ -129,7 +187,7 @@ def stop_recording(summary: str) -> str:
         return f"Error stopping recording: {str(e)}"
 
 @mcp.tool()
-def log_chat_message(text: str, role: str) -> str:
+async def log_chat_message(text: str, role: str) -> str:
     """
     Internal tool to log a message when a session is active.
     
@@ -142,7 +200,14 @@ def log_chat_message(text: str, role: str) -> str:
         return "Skip: No active recording."
     
     try:
-        get_brain().log_session_message(
+        buffer = get_session_log()
+        if buffer is not None:
+            # Written by the buffer's flush thread: no database latency on the chat path
+            buffer.append(recording_session_id, recording_session_name, text, role)
+            return "Message archived."
+        brain = await asyncio.to_thread(get_brain)
+        await asyncio.to_thread(
+            brain.log_session_message,
             recording_session_id, 
             recording_session_name, 
             text, 
@@ -154,7 +219,7 @@ def log_chat_message(text: str, role: str) -> str:
         return f"Error archiving message: {str(e)}"
 
 @mcp.tool()
-def add_memory(text: str, role: str = "user", entities: list[str] = None) -> str:
+async def add_memory(text: str, role: str = "user", entities: list[str] = None) -> str:
     """
     Ingest a new memory into the Holographic Cognitive Memory System.
     This stores the text as a chunk, extracts entities, and updates the RAPTOR tree.
@@ -167,14 +232,32 @@ def add_memory(text: str, role: str = "user", entities: list[str] = None) -> str
     """
     logger.debug(f"Tool add_memory called with text: {text[:20]}...")
     try:
-        get_brain().add_memory(text, role=role, entities=entities)
+        await (await get_async_brain()).add_memory(text, role=role, entities=entities)
         return f"Successfully stored memory: {text[:50]}..."
     except Exception as e:
         logger.exception("Error in add_memory tool")
         return f"Error storing memory: {str(e)}"
 
 @mcp.tool()
-def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
+async def add_memories(memories: list[dict]) -> str:
+    """
+    Ingest many memories at once in a single database transaction.
+    Use this instead of repeated add_memory calls when importing notes or documents.
+    
+    Args:
+        memories: List of dictionaries, each containing 'text' (str) and optionally
+                  'role' (str, default "user") and 'entities' (list[str]).
+    """
+    logger.debug(f"Tool add_memories called with {len(memories)} memories")
+    try:
+        chunk_ids = await (await get_async_brain()).add_memories(memories)
+        return f"Successfully stored {len(chunk_ids)} memories."
+    except Exception as e:
+        logger.exception("Error in add_memories tool")
+        return f"Error storing memories: {str(e)}"
+
+@mcp.tool()
+async def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
     """
     Retrieve context from memory based on a query.
     
@@ -186,22 +269,11 @@ def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
     """
     logger.debug(f"Tool retrieve_memory called with query: {query}, fast_mode: {fast_mode}")
     try:
-        brain = get_brain()
+        brain = await get_async_brain()
         
         if fast_mode:
             # Rapid Search: Only Knowledge Graph
-            # We extract keywords locally using a simple heuristic to stay fast
-            keywords = [w.strip(".,!?") for w in query.split() if w[0].isupper() and len(w) > 1]
-            graph_context = []
-            if keywords:
-                res = brain._query_neo4j("""
-                    MATCH (e:Entity)
-                    WHERE e.name IN $keywords
-                    MATCH (e)-[r:RELATED_TO]-(neighbor)
-                    RETURN e.name + ' is related to ' + neighbor.name as fact
-                    LIMIT 10
-                """, {"keywords": keywords})
-                graph_context = [r["row"][0] for r in res["results"][0]["data"]]
+            graph_context = await brain.recall_graph(query, limit=10)
             
             output = ["### Fast Knowledge Graph Recall (Bypassing AI)"]
             if graph_context:
@@ -213,7 +285,7 @@ def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
         
         else:
             # Holographic Search: Vector + RAPTOR + Graph
-            results = brain.retrieve(query, top_k=top_k)
+            results = await brain.retrieve(query, top_k=top_k)
             
             output = []
             output.append("### Episodic Memory (Direct Hits)")
@@ -227,6 +299,11 @@ def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
             output.append("\n### Relational Facts (Knowledge Graph)")
             for fact in results["knowledge_graph"]:
                 output.append(f"- {fact}")
+
+            if results["graph_memories"]:
+                output.append("\n### Related Memories (Graph: " + ", ".join(results["related_entities"]) + ")")
+                for memory in results["graph_memories"]:
+                    output.append(f"- {memory}")
                 
             return "\n".join(output)
 
@@ -235,7 +312,7 @@ def retrieve_memory(query: str, top_k: int = 3, fast_mode: bool = True) -> str:
         return f"Error retrieving memory: {str(e)}"
 
 @mcp.tool()
-def chat_with_memory(prompt: str) -> str:
+async def chat_with_memory(prompt: str) -> str:
     """
     Directly chat with the memory system using the configured LLM.
     This allows for reasoning over stored knowledge without external processing.
@@ -243,22 +320,18 @@ def chat_with_memory(prompt: str) -> str:
     logger.debug(f"Tool chat_with_memory called with prompt: {prompt[:20]}...")
     try:
         # 1. Retrieve context first
-        brain = get_brain()
-        context = brain.retrieve(prompt, top_k=3)
+        brain = await get_async_brain()
+        context = await brain.retrieve(prompt, top_k=3)
         
         # 2. Check for flagged dissonance in retrieved context
-        # We search if any of the episodic hits are marked with potential_dissonance
-        result_diss = brain._query_neo4j("""
-            MATCH (c:Chunk)
-            WHERE c.text IN $hits AND c.potential_dissonance = true
-            RETURN c.text as text, c.dissonance_report as report
-        """, {"hits": context["episodic_hits"]})
+        # The episodic hits already carry their potential_dissonance flags
+        flagged = [hit for hit in context["episodic_details"] if hit["potential_dissonance"]]
         
         dissonance_warnings = ""
-        if result_diss["results"][0]["data"]:
+        if flagged:
             dissonance_warnings = "\n--- WARNING: Potential Cognitive Dissonance Detected in Memory ---\n"
-            for r in result_diss["results"][0]["data"]:
-                dissonance_warnings += f"Memory: {r['row'][0][:50]}...\nIssue: {r['row'][1]}\n"
+            for hit in flagged:
+                dissonance_warnings += f"Memory: {hit['text'][:50]}...\nIssue: {hit['dissonance_report']}\n"
         
         context_str = "\n".join([
             "Context from Memory:",
@@ -267,7 +340,9 @@ def chat_with_memory(prompt: str) -> str:
             "--- Summaries ---",
             "\n".join(context["raptor_summary"]),
             "--- Knowledge Graph ---",
-            "\n".join(context["knowledge_graph"])
+            "\n".join(context["knowledge_graph"]),
+            "--- Related Memories ---",
+            "\n".join(context["graph_memories"]),
         ])
         
         # 3. Augment prompt
@@ -283,14 +358,14 @@ def chat_with_memory(prompt: str) -> str:
         """
         
         # 4. Generate response using internal LLM
-        response = brain._chat(augmented_prompt)
+        response = await brain._chat(augmented_prompt)
         return response
     except Exception as e:
         logger.exception("Error in chat_with_memory tool")
         return f"Error processing chat: {str(e)}"
 
 @mcp.tool()
-def update_memory_chunk(chunk_id: str, new_text: str) -> str:
+async def update_memory_chunk(chunk_id: str, new_text: str) -> str:
     """
     Update the text of a specific memory chunk.
     This is useful for correcting information or resolving cognitive dissonance.
@@ -298,23 +373,15 @@ def update_memory_chunk(chunk_id: str, new_text: str) -> str:
     """
     logger.debug(f"Tool update_memory_chunk called for id: {chunk_id}")
     try:
-        brain = get_brain()
-        # Update text and reset flags to trigger re-processing
-        brain._query_neo4j("""
-            MATCH (c:Chunk {id: $id})
-            SET c.text = $text, 
-                c.needs_embedding = true, 
-                c.dissonance_checked = null, 
-                c.potential_dissonance = null,
-                c.dissonance_report = null
-        """, {"id": chunk_id, "text": new_text})
+        brain = await asyncio.to_thread(get_brain)
+        await asyncio.to_thread(brain.update_memory_chunk, chunk_id, new_text)
         return f"Memory chunk {chunk_id} updated. It will be re-processed by the background worker."
     except Exception as e:
         logger.exception("Error in update_memory_chunk tool")
         return f"Error updating memory: {str(e)}"
 
 @mcp.tool()
-def resolve_dissonance(chunk_id: str, resolution: str) -> str:
+async def resolve_dissonance(chunk_id: str, resolution: str) -> str:
     """
     Resolve a flagged cognitive dissonance for a specific memory chunk.
     
@@ -327,17 +394,12 @@ def resolve_dissonance(chunk_id: str, resolution: str) -> str:
     """
     logger.debug(f"Tool resolve_dissonance called for id: {chunk_id} with resolution: {resolution}")
     try:
-        brain = get_brain()
+        brain = await asyncio.to_thread(get_brain)
         if resolution.lower() == "accept":
-            brain._query_neo4j("""
-                MATCH (c:Chunk {id: $id})
-                SET c.potential_dissonance = false, 
-                    c.dissonance_resolved = true,
-                    c.dissonance_report = null
-            """, {"id": chunk_id})
+            await asyncio.to_thread(brain.accept_dissonance, chunk_id)
             return f"Dissonance for chunk {chunk_id} accepted and resolved."
         elif resolution.lower() == "reject":
-            brain.forget_memory(chunk_id)
+            await asyncio.to_thread(brain.forget_memory, chunk_id)
             return f"Memory chunk {chunk_id} rejected and deleted."
         else:
             return "Invalid resolution option. Use 'accept', 'reject', or use update_memory_chunk tool for modifications."
@@ -346,21 +408,22 @@ def resolve_dissonance(chunk_id: str, resolution: str) -> str:
         return f"Error resolving dissonance: {str(e)}"
 
 @mcp.tool()
-def forget_memory(chunk_id: str) -> str:
+async def forget_memory(chunk_id: str) -> str:
     """
     Remove a specific memory chunk and trigger graph pruning.
     Use this if information is known to be false or obsolete.
     """
     logger.debug(f"Tool forget_memory called with id: {chunk_id}")
     try:
-        get_brain().forget_memory(chunk_id)
+        brain = await asyncio.to_thread(get_brain)
+        await asyncio.to_thread(brain.forget_memory, chunk_id)
         return f"Memory chunk {chunk_id} has been forgotten and orphaned graph nodes pruned."
     except Exception as e:
         logger.exception("Error in forget_memory tool")
         return f"Error forgetting memory: {str(e)}"
 
 @mcp.tool()
-def trigger_consolidation() -> str:
+async def trigger_consolidation() -> str:
     """
     Manually trigger the RAPTOR summarization process.
     This consolidates recent memory chunks into higher-level abstract summaries.
@@ -368,14 +431,15 @@ def trigger_consolidation() -> str:
     """
     logger.debug("Tool trigger_consolidation called")
     try:
-        get_brain().trigger_consolidation()
+        brain = await asyncio.to_thread(get_brain)
+        await asyncio.to_thread(brain.trigger_consolidation)
         return "RAPTOR consolidation process triggered successfully."
     except Exception as e:
         logger.exception("Error in trigger_consolidation tool")
         return f"Error triggering consolidation: {str(e)}"
 
 @mcp.tool()
-def query_knowledge_graph(cypher: str, parameters: dict = None) -> str:
+async def query_knowledge_graph(cypher: str, parameters: dict = None) -> str:
     """
     Directly query the Neo4j Knowledge Graph using Cypher syntax.
     Bypasses Ollama and vector search for precise, fast relational retrieval.
@@ -386,31 +450,45 @@ def query_knowledge_graph(cypher: str, parameters: dict = None) -> str:
     """
     logger.debug(f"Tool query_knowledge_graph called with query: {cypher}")
     try:
-        brain = get_brain()
-        result = brain._query_neo4j(cypher, parameters)
+        brain = await get_async_brain()
+        # User Cypher may not be idempotent or may need auto-commit: never replayed
+        result = await brain._query_neo4j(cypher, parameters, managed=False)
+        # The query may have written anything: invalidate cached retrievals and let the
+        # entity gazetteer and graph snapshot pick up the change
+        await asyncio.to_thread(brain.result_cache.generation.bump)
         return json.dumps(result, indent=2)
     except Exception as e:
         logger.exception("Error in query_knowledge_graph tool")
         return f"Error executing Cypher query: {str(e)}"
 
 @mcp.tool()
-def get_session_logs(session_id: str) -> str:
+async def get_session_logs(session_id: str, cursor: int = None, limit: int = SESSION_PAGE_SIZE, since: str = None,
+                           until: str = None, tail: bool = False) -> str:
     """
-    Retrieves the chronological message log for a specific session.
+    Retrieves one page of the chronological message log of a specific session.
+
+    Args:
+        session_id: The session to read.
+        cursor: Sequence number returned by the previous call, to read the next page.
+        limit: Maximum number of messages per page (default and maximum: RAIVEN_SESSION_PAGE_SIZE, 200 unless configured).
+        since: Optional ISO datetime; only messages logged at or after it.
+        until: Optional ISO datetime; only messages logged before it.
+        tail: If True, returns the latest messages, and the cursor pages backwards.
     """
     logger.debug(f"Tool get_session_logs called for session: {session_id}")
     try:
-        brain = get_brain()
-        cypher = """
-        MATCH (s:Session {id: $sid})-[:HAS_MESSAGE]->(m:MessageLog)
-        RETURN m.role as role, m.text as text, m.timestamp as time
-        ORDER BY m.timestamp ASC
-        """
-        result = brain._query_neo4j(cypher, {"sid": session_id})
+        brain = await get_async_brain()
+        await flush_session_log()
+        page = await brain.get_session_messages(
+            session_id, cursor=cursor, limit=min(max(1, limit), SESSION_PAGE_SIZE), since=since, until=until, tail=tail,
+        )
         
         output = [f"--- Backup Log for Session: {session_id} ---"]
-        for r in result["results"][0]["data"]:
-            output.append(f"[{r['row'][2]}] {r['row'][0].upper()}: {r['row'][1]}")
+        for m in page["messages"]:
+            output.append(f"#{m['seq']} [{m['timestamp']}] {m['role'].upper()}: {m['text']}")
+        if page["next_cursor"] is not None:
+            direction = "earlier" if tail else "more"
+            output.append(f"--- {direction} messages: call again with cursor={page['next_cursor']} ---")
         
         return "\n\n".join(output)
     except Exception as e:
@@ -418,14 +496,14 @@ def get_session_logs(session_id: str) -> str:
         return f"Error retrieving logs: {str(e)}"
 
 @mcp.tool()
-def list_memory_profiles() -> str:
+async def list_memory_profiles() -> str:
     """
     List all available memory profiles (databases) in the system.
     Note: In Community Edition, only the default 'neo4j' database is available.
     """
     logger.debug("Tool list_memory_profiles called")
     try:
-        brain = get_brain()
+        brain = await get_async_brain()
         return f"Available Memory Profiles:\n- {brain.database} (Neo4j Community Edition: Single Database Mode)"
     except Exception as e:
         logger.exception("Error in list_memory_profiles tool")
@@ -447,6 +525,7 @@ tool_functions = {
     "stop_recording": stop_recording,
     "log_chat_message": log_chat_message,
     "add_memory": add_memory,
+    "add_memories": add_memories,
     "retrieve_memory": retrieve_memory,
     "chat_with_memory": chat_with_memory,
     "update_memory_chunk": update_memory_chunk,
@@ -460,7 +539,7 @@ tool_functions = {
 }
 
 @mcp.tool()
-def batch_tools(tool_calls: list[dict]) -> str:
+async def batch_tools(tool_calls: list[dict]) -> str:
     """
     Execute multiple MCP tools in a single call to improve efficiency.
 
@@ -477,6 +556,8 @@ def batch_tools(tool_calls: list[dict]) -> str:
             continue
         try:
             result = tool_functions[tool_name](**args)
+            if inspect.isawaitable(result):
+                result = await result
             results.append({"tool": tool_name, "result": result})
         except Exception as e:
             logger.exception(f"Error in batch tool {tool_name}")
@@ -510,6 +591,21 @@ def main():
         sys.exit(1)
         logger.exception("MCP Server crashed during run")
         sys.exit(1)
+    finally:
+        # Write the buffered session messages, then release pooled Neo4j connections
+        if session_log is not None:
+            try:
+                session_log.close()
+            except Exception:
+                logger.exception("Could not write the buffered session messages")
+        if brain is not None:
+            brain.close()
+        if async_brain is not None:
+            try:
+                asyncio.run(async_brain.close())
+            except Exception:
+                # The server's event loop is already gone; the process is exiting anyway
+                pass
 
 if __name__ == "__main__":
     main()
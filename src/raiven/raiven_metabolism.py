@@ -2,6 +2,7 @@ import time
 import sys
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging at module level for entry point compatibility
 logging.basicConfig(
@@ -10,15 +11,309 @@ logging.basicConfig(
     stream=sys.stdout
 )
 
-from . import CognitiveMemory
+from . import (
+    CognitiveMemory,
+    EMBED_BATCH_MAX,
+    EMBED_TARGET_SECONDS,
+    METABOLISM_CPU_BUDGET,
+    METABOLISM_MAX_LOAD,
+    METABOLISM_IDLE_SECONDS,
+    METABOLISM_THREADS,
+    METABOLISM_POLL_SECONDS,
+    WAKEUP_DIR,
+    EDGE_HALF_LIFE_DAYS,
+    EDGE_DECAY_INTERVAL_SECONDS,
+)
+from .raiven_notify import WakeupListener
 
 logger = logging.getLogger("raiven_metabolism")
 
+# Error backoff bounds for a failing task, in seconds
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 300
+# A due task passed over this many times runs before higher-priority work
+STARVATION_LIMIT = 5
+# How often the liveness heartbeat is written, in seconds
+HEARTBEAT_SECONDS = 60
+
+class AdaptiveBatchSize:
+    """
+    Latency-driven controller for the embedding batch size.
+    The batch grows while Ollama answers well under the target latency and is halved
+    as soon as a request takes longer, so throughput follows the server's capacity.
+    """
+    def __init__(self, maximum: int = EMBED_BATCH_MAX, target_seconds: float = EMBED_TARGET_SECONDS):
+        self.maximum = max(1, maximum)
+        self.target_seconds = target_seconds
+        self.size = 1
+
+    def update(self, processed: int, elapsed: float):
+        if elapsed > self.target_seconds:
+            self.size = max(1, self.size // 2)
+        elif processed >= self.size and elapsed < self.target_seconds / 2:
+            # Only grow on full batches: a short batch says nothing about capacity
+            self.size = min(self.maximum, self.size * 2)
+
+class MetabolismTask:
+    """
+    A unit of background work. `run` returns how many items it processed: while it
+    finds work the task stays due, and once it returns zero it is not polled again
+    for `idle_seconds`.
+    """
+    def __init__(self, name: str, run, idle_seconds: float):
+        self.name = name
+        self.run = run
+        self.idle_seconds = idle_seconds
+        self.next_due = 0.0
+        self.failures = 0
+        self.skipped = 0
+        self.latency = None # Moving average of seconds per run
+
+class MetabolismScheduler:
+    """
+    Picks the next background task by priority and backlog instead of sleeping for
+    fixed intervals. Work is paced by its own measured duration (mostly Ollama
+    latency) against an optional CPU budget and load-average ceiling, and a task only
+    backs off exponentially when it fails.
+
+    Several schedulers can share one brain (and run in other processes or hosts):
+    chunk work is leased under `worker_id`, and only schedulers created with
+    `maintenance=True` run the graph-wide pruning sweep and the heartbeat.
+
+    With a wake-up listener, the chunk tasks are driven by write notifications and
+    only polled every `poll_seconds` as a fallback, so an idle worker stays silent.
+    """
+    def __init__(self, brain: CognitiveMemory, worker_id: str = None, maintenance: bool = True,
+                 cpu_budget: float = METABOLISM_CPU_BUDGET, max_load: float = METABOLISM_MAX_LOAD,
+                 idle_seconds: float = METABOLISM_IDLE_SECONDS, wakeup: WakeupListener = None,
+                 poll_seconds: float = METABOLISM_POLL_SECONDS):
+        self.brain = brain
+        self.wakeup = wakeup if wakeup is not None and wakeup.active else None
+        self.idle = False
+        self.worker_id = worker_id or brain.worker_id
+        self.maintenance = maintenance
+        self.cpu_budget = min(1.0, max(0.01, cpu_budget))
+        self.max_load = max_load
+        self.idle_seconds = idle_seconds
+        self.batch_size = AdaptiveBatchSize()
+        self.prune_cursor = ""
+        self.pruned_generation = None
+        self.pruned_at = None
+        self.mirror_kind = "chunk"
+        self.mirror_cursor = ""
+        self.mirrored_generation = None
+        self.last_heartbeat = None
+        self.last_status = None
+        # Without notifications the chunk tasks have to be polled often
+        self.poll_seconds = max(idle_seconds, poll_seconds) if self.wakeup else None
+        # In priority order
+        self.chunk_tasks = [
+            # 1. Pending embeddings (Highest Priority for Search)
+            MetabolismTask("embeddings", self._process_embeddings, idle_seconds=self.poll_seconds or min(10, idle_seconds)),
+            # 2. Cognitive dissonance (Medium Priority)
+            MetabolismTask("dissonance", lambda: self.brain._resolve_cognitive_dissonance(self.worker_id), idle_seconds=self.poll_seconds or min(30, idle_seconds)),
+            # 3. Summaries invalidated by edits (corrections first)
+            MetabolismTask("summaries", lambda: self.brain._refresh_dirty_summaries(self.worker_id), idle_seconds=self.poll_seconds or idle_seconds),
+            # 4. RAPTOR summarization (Low Priority)
+            MetabolismTask("raptor", lambda: self.brain._update_raptor_tree(self.worker_id), idle_seconds=self.poll_seconds or idle_seconds),
+        ]
+        self.tasks = list(self.chunk_tasks)
+        if maintenance:
+            # 5. Graph pruning (Lowest Priority), one full sweep per idle period
+            self.tasks.append(MetabolismTask("prune", self._prune, idle_seconds=10 * idle_seconds))
+            if brain.vector_index is not None:
+                # 6. Local vector mirror resync (writes are mirrored as they happen)
+                self.tasks.append(MetabolismTask("mirror", self._sync_mirror, idle_seconds=10 * idle_seconds))
+
+    def _process_embeddings(self) -> int:
+        started = time.monotonic()
+        processed = self.brain._process_pending_embeddings(limit=self.batch_size.size, worker_id=self.worker_id)
+        self.batch_size.update(processed, time.monotonic() - started)
+        return processed
+
+    def _prune(self) -> int:
+        if not self.prune_cursor:
+            # Nothing was written since the last full sweep and no decay is due: skip it
+            # without touching Neo4j
+            generation = self.brain.result_cache.generation.current()
+            decay_due = EDGE_HALF_LIFE_DAYS > 0 and (
+                self.pruned_at is None or time.monotonic() - self.pruned_at >= EDGE_DECAY_INTERVAL_SECONDS
+            )
+            if generation == self.pruned_generation and not decay_due:
+                return 0
+            self.pruned_generation = generation
+            self.pruned_at = time.monotonic()
+        # Walks the entities in fixed-size transactions, resuming where the last run stopped
+        before = self.brain.result_cache.generation.current()
+        self.prune_cursor, removed = self.brain.prune_weak_connections_batch(cursor=self.prune_cursor)
+        if self.pruned_generation == before:
+            # The sweep's own bump (decayed or removed edges) is no reason for another sweep
+            self.pruned_generation = self.brain.result_cache.generation.current()
+        if removed:
+            logger.info(f"Pruned {removed} weak connections.")
+        return 1 if self.prune_cursor else 0
+
+    def _sync_mirror(self) -> int:
+        index = self.brain.vector_index
+        if self.mirror_kind == "chunk" and not self.mirror_cursor:
+            # Writes are mirrored inline; a sweep only catches what happened elsewhere
+            generation = self.brain.result_cache.generation.current()
+            if generation == self.mirrored_generation and index.ready():
+                return 0
+            self.mirrored_generation = generation
+        self.mirror_cursor = self.brain.sync_vector_mirror_batch(self.mirror_kind, self.mirror_cursor)
+        if self.mirror_cursor:
+            return 1
+        if self.mirror_kind == "chunk":
+            self.mirror_kind = "summary"
+            return 1
+
+        self.mirror_kind = "chunk"
+        if not index.ready():
+            logger.info(f"Vector mirror synced: {index.stats()}")
+        index.mark_synced()
+        if index.needs_training():
+            index.train_ivf()
+        return 0
+
+    def _heartbeat(self, now: float, busy: bool):
+        if not self.maintenance:
+            return
+        status = "busy" if busy else "active"
+        # An idle event-driven worker only reports in at its fallback poll interval
+        interval = self.poll_seconds if self.poll_seconds and not busy else HEARTBEAT_SECONDS
+        if status == self.last_status and now - self.last_heartbeat < interval:
+            return
+        try:
+            self.brain._query_neo4j("""
+                MERGE (h:Heartbeat {id: 'metabolism'})
+                SET h.last_seen = datetime(),
+                    h.status = $status,
+                    h.worker = $worker
+            """, {"status": status, "worker": self.worker_id})
+            self.last_heartbeat = now
+            self.last_status = status
+            if not busy:
+                logger.info(f"System up to date. Embedding cache: {self.brain.embedding_cache.stats()}.")
+        except Exception as e:
+            logger.error(f"Failed to update heartbeat: {e}")
+
+    def _pick(self, due):
+        for task in due:
+            if task.skipped >= STARVATION_LIMIT:
+                return task
+        return due[0]
+
+    def _pace(self, elapsed: float) -> float:
+        """
+        Seconds to pause after `elapsed` seconds of work.
+        """
+        # Busy for `cpu_budget` of the wall time: work w, then rest w * (1 - b) / b
+        pause = elapsed * (1 - self.cpu_budget) / self.cpu_budget
+        if self.max_load > 0 and hasattr(os, "getloadavg"):
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if load > self.max_load:
+                pause = max(pause, elapsed, 1.0)
+        return pause
+
+    def run_once(self) -> float:
+        """
+        Runs at most one task and returns how long to sleep before the next call.
+        """
+        now = time.monotonic()
+        due = [t for t in self.tasks if t.next_due <= now]
+        self._heartbeat(now, busy=bool(due))
+        self.idle = not due
+        if not due:
+            return min(self.idle_seconds, min(t.next_due for t in self.tasks) - now)
+
+        task = self._pick(due)
+        for other in due:
+            other.skipped = 0 if other is task else other.skipped + 1
+
+        started = time.monotonic()
+        try:
+            processed = task.run()
+        except Exception as e:
+            task.failures += 1
+            backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (task.failures - 1))
+            logger.error(f"Metabolism task '{task.name}' failed (attempt {task.failures}), retrying in {backoff}s: {e}")
+            task.next_due = time.monotonic() + backoff
+            return 0.0
+
+        elapsed = time.monotonic() - started
+        task.failures = 0
+        task.latency = elapsed if task.latency is None else 0.8 * task.latency + 0.2 * elapsed
+        if processed:
+            logger.info(f"Metabolism task '{task.name}' processed {processed} items in {elapsed:.2f}s")
+            # Still has backlog: stay due, only paced by the budget
+            task.next_due = 0.0
+            if task in self.chunk_tasks:
+                # Embedded chunks are ready for dissonance checks and summaries
+                self._wake()
+            return self._pace(elapsed)
+
+        task.next_due = time.monotonic() + task.idle_seconds
+        return 0.0
+
+    def _wake(self):
+        """
+        Makes the chunk tasks due now, except those backing off after a failure.
+        """
+        for task in self.chunk_tasks:
+            if not task.failures:
+                task.next_due = 0.0
+
+    def run_forever(self):
+        while True:
+            pause = self.run_once()
+            if pause <= 0:
+                continue
+            if self.idle and self.wakeup is not None:
+                # Pacing pauses are not cut short; idle waits end on the next write
+                if self.wakeup.wait(pause):
+                    self._wake()
+            else:
+                time.sleep(pause)
+
+def run_schedulers(brain: CognitiveMemory, threads: int = METABOLISM_THREADS):
+    """
+    Runs `threads` schedulers on a shared brain. Most of a task's time is spent
+    waiting on Ollama and Neo4j, so threads overlap those calls; leases keep them
+    from picking the same chunks.
+    """
+    threads = max(1, threads)
+    # One wake-up socket per scheduler, so a single write wakes every idle thread
+    listeners = [WakeupListener(WAKEUP_DIR) for _ in range(threads)] if WAKEUP_DIR else [None] * threads
+    if listeners[0] is None or not listeners[0].active:
+        logger.info("Wake-up notifications unavailable, polling for new work")
+    try:
+        if threads == 1:
+            MetabolismScheduler(brain, wakeup=listeners[0]).run_forever()
+            return
+
+        logger.info(f"Starting {threads} metabolism threads as {brain.worker_id}")
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="metabolism") as pool:
+            futures = [
+                pool.submit(MetabolismScheduler(
+                    brain, worker_id=f"{brain.worker_id}#{i}", maintenance=(i == 0), wakeup=listeners[i],
+                ).run_forever)
+                for i in range(threads)
+            ]
+            for future in futures:
+                # run_forever only returns by raising; surface the first failure
+                future.result()
+    finally:
+        for listener in listeners:
+            if listener is not None:
+                listener.close()
+
 def run_metabolism_cycle():
     """
     Main loop for the background metabolism process.
-    It processes embeddings, cognitive dissonance, and RAPTOR summarization
-    at a slow pace to avoid overloading the server.
+    It processes embeddings, cognitive dissonance, RAPTOR summarization and graph
+    pruning, paced by the scheduler to avoid overloading the server. Any number of
+    these processes may run against the same database.
     """
     logger = logging.getLogger("raiven_metabolism")
     logger.info("Raiven Metabolism Process Started")
@@ -31,79 +326,10 @@ def run_metabolism_cycle():
         logger.error(f"Failed to connect to memory: {e}")
         return
 
-    while True:
-        try:
-            # 1. Process Pending Embeddings (Highest Priority for Search)
-            # Check if there are chunks needing embedding
-            result = brain._query_neo4j("""
-                MATCH (c:Chunk {needs_embedding: true})
-                RETURN count(c) as count
-            """)
-            
-            # Defensive check for Neo4j response structure
-            if not result or "results" not in result or not result["results"]:
-                logger.warning("Empty or invalid result from Neo4j")
-                time.sleep(30)
-                continue
-                
-            pending_emb = result["results"][0]["data"][0]["row"][0]
-            
-            if pending_emb > 0:
-                logger.info(f"Processing 1 of {pending_emb} pending embeddings...")
-                try:
-                    brain._process_pending_embeddings(limit=1)
-                except Exception as e:
-                    logger.error(f"Embedding failed (server might be busy): {e}")
-                
-                # Longer sleep to let CPU cool down
-                time.sleep(15)
-                continue # Loop back to prioritize embeddings
-
-            # 2. Resolve Cognitive Dissonance (Medium Priority)
-            # Check for unchecked chunks
-            result_diss = brain._query_neo4j("""
-                MATCH (c:Chunk)
-                WHERE c.dissonance_checked IS NULL AND NOT c.needs_embedding
-                RETURN count(c) as count
-            """)
-            
-            if not result_diss or "results" not in result_diss or not result_diss["results"]:
-                pending_diss = 0
-            else:
-                pending_diss = result_diss["results"][0]["data"][0]["row"][0]
-            
-            if pending_diss > 0:
-                logger.info(f"Analyzing dissonance for 1 of {pending_diss} chunks...")
-                brain._resolve_cognitive_dissonance() # Processes 1 chunk internally
-                # Significant sleep after LLM usage
-                time.sleep(20)
-                continue
-
-            # 3. RAPTOR Summarization (Low Priority)
-            # Only run if no other tasks are pending
-            # We can implement a check to see if enough new chunks exist to warrant a summary
-            # For now, we just run the update check occasionally
-            logger.info("Checking RAPTOR tree updates...")
-            brain._update_raptor_tree()
-            
-            # If we got here, the system is mostly up to date. Long sleep.
-            logger.info("System up to date. Sleeping...")
-            
-            # Update heartbeat in Neo4j
-            try:
-                brain._query_neo4j("""
-                    MERGE (h:Heartbeat {id: 'metabolism'})
-                    SET h.last_seen = datetime(),
-                        h.status = 'active'
-                """)
-            except Exception as e:
-                logger.error(f"Failed to update heartbeat: {e}")
-                
-            time.sleep(60)
-
-        except Exception as e:
-            logger.error(f"Error in metabolism cycle: {e}")
-            time.sleep(60) # Wait on error
+    try:
+        run_schedulers(brain)
+    finally:
+        brain.close()
 
 def main():
     # Ensure we can import raiven package
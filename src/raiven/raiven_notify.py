@@ -0,0 +1,101 @@
+import os
+import sys
+import glob
+import uuid
+import socket
+import threading
+from typing import Optional
+
+# Datagram sockets are connectionless: a writer never waits for a sleeping or dead worker
+_SUPPORTED = hasattr(socket, "AF_UNIX")
+
+class WakeupListener:
+    """
+    Wake-up channel of one metabolism scheduler: a Unix datagram socket in a shared
+    directory. Writers send a byte to every socket there (notify_metabolism), and a
+    background thread turns each datagram into a threading.Event the scheduler waits on.
+    """
+    def __init__(self, directory: str):
+        self.directory = os.path.expanduser(directory)
+        self.event = threading.Event()
+        self.path = None
+        self._sock = None
+        if not _SUPPORTED:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Short random names keep the path under the AF_UNIX length limit
+            self.path = os.path.join(self.directory, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.bind(self.path)
+        except OSError as e:
+            print(f"Warning: Wake-up socket in {self.directory} unavailable, falling back to polling: {e}", file=sys.stderr)
+            self._sock = None
+            self.path = None
+            return
+        threading.Thread(target=self._listen, name="metabolism-wakeup", daemon=True).start()
+
+    @property
+    def active(self) -> bool:
+        return self._sock is not None
+
+    def _listen(self):
+        sock = self._sock
+        while True:
+            try:
+                sock.recv(64)
+            except OSError:
+                # Socket closed
+                return
+            self.event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Blocks until a wake-up arrives or `timeout` elapses. Returns True when woken.
+        """
+        woken = self.event.wait(timeout)
+        self.event.clear()
+        return woken
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+def notify_metabolism(directory: Optional[str]):
+    """
+    Wakes every metabolism scheduler listening in `directory`. Never blocks and never
+    raises: workers that are not listening keep finding the work by polling.
+    Sockets left behind by dead workers are removed.
+    """
+    if not directory or not _SUPPORTED:
+        return
+    paths = glob.glob(os.path.join(os.path.expanduser(directory), "*.sock"))
+    if not paths:
+        return
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    except OSError:
+        return
+    try:
+        sock.setblocking(False)
+        for path in paths:
+            try:
+                sock.sendto(b"1", path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Nobody bound to it any more
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except OSError:
+                # Buffer full: a wake-up is already pending
+                pass
+    finally:
+        sock.close()
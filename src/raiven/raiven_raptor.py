@@ -0,0 +1,87 @@
+import math
+import numpy as np
+from typing import List
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 25, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means (cosine similarity, like the vector indexes) with k-means++
+    seeding. Returns the cluster label of every row.
+    """
+    n = len(vectors)
+    if k >= n:
+        return np.arange(n)
+    if k <= 1:
+        return np.zeros(n, dtype=np.int64)
+
+    rng = np.random.default_rng(seed)
+    x = _normalize(np.asarray(vectors, dtype=np.float32))
+
+    # k-means++: each next seed is drawn proportionally to its distance from the chosen ones
+    centroids = np.empty((k, x.shape[1]), dtype=np.float32)
+    centroids[0] = x[rng.integers(n)]
+    distance = np.maximum(1.0 - x @ centroids[0], 0.0)
+    for i in range(1, k):
+        total = distance.sum()
+        index = rng.choice(n, p=distance / total) if total > 0 else rng.integers(n)
+        centroids[i] = x[index]
+        distance = np.minimum(distance, np.maximum(1.0 - x @ centroids[i], 0.0))
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(x @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, x)
+        counts = np.bincount(labels, minlength=k)
+        # An empty cluster keeps its previous centroid
+        centroids = np.where(counts[:, None] > 0, _normalize(sums), centroids)
+    return labels
+
+def cluster(vectors: np.ndarray, size: int, min_size: int = 1) -> List[np.ndarray]:
+    """
+    Groups rows into semantically coherent clusters of roughly `size` members.
+    Clusters larger than twice the target are split again, so one summary prompt
+    never has to cover an unbounded number of children, and clusters smaller than
+    `min_size` are merged into the closest other cluster.
+    Returns arrays of row indexes.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    if n == 0:
+        return []
+    size = max(2, size)
+    if n <= 2 * size:
+        k = max(1, round(n / size))
+    else:
+        k = math.ceil(n / size)
+    labels = kmeans(vectors, k)
+
+    groups = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        if len(members) > 2 * size:
+            if len(members) == n:
+                # k-means could not separate them (e.g. identical vectors): cut in order
+                groups.extend(members[i:i + size] for i in range(0, len(members), size))
+            else:
+                groups.extend(members[sub] for sub in cluster(vectors[members], size))
+        else:
+            groups.append(members)
+    return _merge_small(vectors, groups, min_size)
+
+def _merge_small(vectors: np.ndarray, groups: List[np.ndarray], min_size: int) -> List[np.ndarray]:
+    x = _normalize(vectors)
+    groups = sorted(groups, key=len)
+    while len(groups) > 1 and len(groups[0]) < min_size:
+        small = groups.pop(0)
+        centroids = _normalize(np.stack([x[g].mean(axis=0) for g in groups]))
+        target = int(np.argmax(centroids @ x[small].mean(axis=0)))
+        groups[target] = np.concatenate([groups[target], small])
+        groups.sort(key=len)
+    return groups
@@ -0,0 +1,146 @@
+import sys
+from typing import Callable, Dict, Any, List, Tuple, Union
+
+# A migration step is either a Cypher statement or a callable receiving the query function
+Step = Union[str, Callable[[Callable[..., Dict[str, Any]]], None]]
+
+# Rows updated per transaction by data backfills
+BACKFILL_BATCH_SIZE = 10000
+
+def _backfill(cypher: str, batch: int = BACKFILL_BATCH_SIZE) -> Callable[[Callable[..., Dict[str, Any]]], None]:
+    """
+    Builds a step that repeats a `... LIMIT $batch SET ... RETURN count(*)` statement
+    until it touches no rows, so large graphs are migrated in bounded transactions.
+    """
+    def step(query):
+        while True:
+            result = query(cypher, {"batch": batch})
+            if result["results"][0]["data"][0]["row"][0] == 0:
+                return
+    return step
+
+def migrations(vector_dimensions: int) -> List[Tuple[int, str, List[Step]]]:
+    """
+    Ordered schema migrations as (version, description, steps).
+    Every step is idempotent, so concurrent starts (MCP server and metabolism) are safe.
+    """
+    return [
+        (1, "Vector indexes and entity name constraint", [
+            f"""
+            CREATE VECTOR INDEX chunk_embeddings IF NOT EXISTS
+            FOR (c:Chunk) ON (c.embedding)
+            OPTIONS {{indexConfig: {{
+             `vector.dimensions`: {vector_dimensions},
+             `vector.similarity_function`: 'cosine'
+            }}}}
+            """,
+            f"""
+            CREATE VECTOR INDEX summary_embeddings IF NOT EXISTS
+            FOR (s:Summary) ON (s.embedding)
+            OPTIONS {{indexConfig: {{
+             `vector.dimensions`: {vector_dimensions},
+             `vector.similarity_function`: 'cosine'
+            }}}}
+            """,
+            """
+            CREATE CONSTRAINT entity_id IF NOT EXISTS
+            FOR (e:Entity) REQUIRE e.name IS UNIQUE
+            """,
+        ]),
+        (2, "Uniqueness constraints and range indexes for hot lookup keys", [
+            "CREATE CONSTRAINT chunk_id IF NOT EXISTS FOR (c:Chunk) REQUIRE c.id IS UNIQUE",
+            "CREATE CONSTRAINT summary_id IF NOT EXISTS FOR (s:Summary) REQUIRE s.id IS UNIQUE",
+            "CREATE CONSTRAINT session_id IF NOT EXISTS FOR (s:Session) REQUIRE s.id IS UNIQUE",
+            "CREATE CONSTRAINT message_log_id IF NOT EXISTS FOR (m:MessageLog) REQUIRE m.id IS UNIQUE",
+            "CREATE INDEX chunk_needs_embedding IF NOT EXISTS FOR (c:Chunk) ON (c.needs_embedding)",
+            "CREATE INDEX chunk_dissonance_checked IF NOT EXISTS FOR (c:Chunk) ON (c.dissonance_checked)",
+            "CREATE INDEX chunk_timestamp IF NOT EXISTS FOR (c:Chunk) ON (c.timestamp)",
+            "CREATE INDEX message_log_timestamp IF NOT EXISTS FOR (m:MessageLog) ON (m.timestamp)",
+            # Range indexes cannot answer IS NULL, so unchecked chunks are now stored as false
+            _backfill("""
+                MATCH (c:Chunk)
+                WHERE c.dissonance_checked IS NULL
+                WITH c LIMIT $batch
+                SET c.dissonance_checked = false
+                RETURN count(c)
+            """),
+        ]),
+        (3, "RAPTOR level index", [
+            "CREATE INDEX summary_level IF NOT EXISTS FOR (s:Summary) ON (s.level)",
+        ]),
+        (4, "Dirty summary index for incremental RAPTOR maintenance", [
+            "CREATE INDEX summary_dirty IF NOT EXISTS FOR (s:Summary) ON (s.dirty)",
+        ]),
+        (5, "Change feed index on entity edges for the in-process graph snapshot", [
+            "CREATE INDEX related_to_updated_at IF NOT EXISTS FOR ()-[r:RELATED_TO]-() ON (r.updated_at)",
+        ]),
+        (6, "Session tail pointers and message sequence numbers", [
+            # Sessions are numbered whole, so each transaction is bounded by a few sessions
+            _backfill("""
+                MATCH (s:Session)
+                WHERE s.seq IS NULL
+                WITH s LIMIT $batch
+                OPTIONAL MATCH (s)-[:HAS_MESSAGE]->(m:MessageLog)
+                WITH s, m ORDER BY m.timestamp ASC
+                WITH s, collect(m) AS messages
+                SET s.seq = size(messages)
+                WITH s, messages
+                CALL {
+                    WITH s, messages
+                    UNWIND range(0, size(messages) - 1) AS i
+                    WITH s, i, messages[i] AS m
+                    SET m.seq = i + 1, m.session_id = s.id
+                    RETURN count(*) AS numbered
+                }
+                CALL {
+                    WITH s, messages
+                    UNWIND messages[-1..] AS tail
+                    MERGE (s)-[:LAST_MESSAGE]->(tail)
+                    RETURN count(*) AS linked
+                }
+                RETURN count(s)
+            """, batch=100),
+        ]),
+        (7, "Session log pagination index", [
+            "CREATE INDEX message_log_session_seq IF NOT EXISTS FOR (m:MessageLog) ON (m.session_id, m.seq)",
+        ]),
+    ]
+
+class SchemaManager:
+    """
+    Applies the schema migrations that the database has not seen yet and records the
+    resulting version on a (:SchemaVersion {id: 'raiven'}) node.
+    """
+    def __init__(self, query: Callable[..., Dict[str, Any]], vector_dimensions: int):
+        self.query = query
+        self.vector_dimensions = vector_dimensions
+
+    def current_version(self) -> int:
+        result = self.query("""
+            OPTIONAL MATCH (v:SchemaVersion {id: 'raiven'})
+            RETURN coalesce(v.version, 0) as version
+        """, read_only=True)
+        return result["results"][0]["data"][0]["row"][0]
+
+    def migrate(self) -> int:
+        """
+        Brings the schema up to date and returns the final version.
+        """
+        version = self.current_version()
+        for target, description, steps in migrations(self.vector_dimensions):
+            if target <= version:
+                continue
+            print(f">> Applying schema migration {target}: {description}", file=sys.stderr)
+            # Schema commands cannot share a transaction with data writes, so each step runs alone
+            for step in steps:
+                if callable(step):
+                    step(self.query)
+                else:
+                    self.query(step)
+            self.query("""
+                MERGE (v:SchemaVersion {id: 'raiven'})
+                SET v.version = CASE WHEN coalesce(v.version, 0) < $version THEN $version ELSE v.version END,
+                    v.updated_at = datetime()
+            """, {"version": target})
+            version = target
+        return version
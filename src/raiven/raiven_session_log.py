@@ -0,0 +1,113 @@
+import sys
+import time
+import threading
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Tuple, Callable
+
+# Writes one session's messages (in order) in a single transaction
+Writer = Callable[[str, str, List[Dict[str, Any]]], None]
+
+# Queued message: (session_id, session_name, message, failed write attempts)
+_Entry = Tuple[str, str, Dict[str, Any], int]
+
+class SessionLogBuffer:
+    """
+    Write-behind queue for session messages: `append` only enqueues, and a background
+    thread writes the queue every `flush_seconds` (or as soon as `max_batch` messages
+    are waiting), one transaction per session. Messages keep the time they were
+    appended. A failed write is retried at the next flush, so nothing is lost while
+    Neo4j is briefly unavailable; messages still unwritten after `max_attempts`
+    flushes are logged and dropped, so a lasting failure cannot grow the queue
+    without bound or block the messages behind them.
+    """
+    def __init__(self, writer: Writer, flush_seconds: float = 1.0, max_batch: int = 100,
+                 max_attempts: int = 10):
+        self._writer = writer
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self._condition = threading.Condition()
+        self._pending: List[_Entry] = []
+        # Serialises flushes, so a session's batches are written in order
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="session-log", daemon=True)
+        self._thread.start()
+
+    def append(self, session_id: str, session_name: str, text: str, role: str):
+        message = {"text": text, "role": role, "timestamp": datetime.now(timezone.utc).isoformat()}
+        with self._condition:
+            self._pending.append((session_id, session_name, message, 0))
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+    def pending(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._condition.wait(self.flush_seconds)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: Session log flush failed, retrying in {self.flush_seconds}s: {e}", file=sys.stderr)
+                time.sleep(self.flush_seconds)
+
+    def flush(self):
+        """
+        Writes everything appended so far. Callers that read the logs flush first.
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            sessions: Dict[str, Tuple[str, List[Dict[str, Any]]]] = {}
+            for session_id, session_name, message, _ in batch:
+                sessions.setdefault(session_id, (session_name, []))[1].append(message)
+            # Messages of every session written so far, and the sessions whose write failed
+            written: Dict[str, int] = {}
+            failed: Dict[str, Exception] = {}
+            for session_id, (session_name, messages) in sessions.items():
+                # A failing session must not hold back the others
+                try:
+                    for start in range(0, len(messages), self.max_batch):
+                        self._writer(session_id, session_name, messages[start:start + self.max_batch])
+                        written[session_id] = start + self.max_batch
+                except Exception as e:
+                    failed[session_id] = e
+            if not failed:
+                return
+
+            # Requeue what was not written in front of the newer messages
+            unwritten, dropped = [], {}
+            for session_id, session_name, message, attempts in batch:
+                if session_id not in failed:
+                    continue
+                if written.get(session_id, 0) > 0:
+                    written[session_id] -= 1
+                elif attempts + 1 >= self.max_attempts:
+                    dropped[session_id] = dropped.get(session_id, 0) + 1
+                else:
+                    unwritten.append((session_id, session_name, message, attempts + 1))
+            for session_id, count in dropped.items():
+                print(f"Warning: Dropped {count} messages of session {session_id} after "
+                      f"{self.max_attempts} failed writes: {failed[session_id]}", file=sys.stderr)
+            with self._condition:
+                self._pending[:0] = unwritten
+            raise next(iter(failed.values()))
+
+    def close(self):
+        """
+        Stops the background thread and writes the remaining messages.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._thread.join(timeout=self.flush_seconds + 5)
+        self.flush()
@@ -0,0 +1,309 @@
+import os
+import sys
+import sqlite3
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Tuple, Optional, Dict, Any
+
+try:
+    import fcntl
+except ImportError: # Windows: SQLite still serialises the metadata, writers must not overlap
+    fcntl = None
+
+# Rows scored per block, so a float16 matrix is never upcast in one piece
+SEARCH_BLOCK_ROWS = 65536
+# IVF is trained once there are this many rows per list, and retrained when the corpus doubles
+IVF_MIN_ROWS_PER_LIST = 4
+IVF_TRAINING_SAMPLE = 50000
+
+class LocalVectorIndex:
+    """
+    Local mirror of the chunk and summary embeddings for retrieval without a
+    database round trip.
+
+    Vectors are L2-normalised and stored as rows of a raw float32/float16 matrix
+    file that readers memory-map, so every process on the host shares the same
+    page cache instead of holding its own copy. A SQLite sidecar maps rows to node
+    ids and kinds ("chunk" / "summary"); removed rows are tombstoned and reused.
+    Writers serialise on an fcntl lock. Search is an exact brute-force top-k, or
+    with `ivf_lists` an inverted-file probe of the closest k-means partitions.
+    """
+    def __init__(self, path: str, dimensions: int, dtype: str = "float32", ivf_lists: int = 0):
+        self.path = os.path.expanduser(path)
+        self.dimensions = dimensions
+        self.dtype = np.dtype(dtype)
+        self.ivf_lists = max(0, ivf_lists)
+        self.ivf_probes = max(1, self.ivf_lists // 8)
+        self._lock = threading.Lock()
+        self._view = None # (version, rows, ids, kinds, lists, matrix, centroids)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._matrix_path = f"{self.path}.{self.dtype.name}"
+        self._centroids_path = f"{self.path}.ivf.npy"
+        self._db = sqlite3.connect(f"{self.path}.sqlite3", timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE,
+                kind TEXT,
+                list INTEGER
+            )
+        """)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        for key in ("version", "synced", "ivf_rows", "dimensions"):
+            self._db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES (?, 0)", (key,))
+        if self._meta("dimensions") != dimensions:
+            # New mirror, or the storage layout changed: rebuild from the database
+            with self._write_lock():
+                self._db.execute("DELETE FROM rows")
+                open(self._matrix_path, "wb").close()
+                if os.path.exists(self._centroids_path):
+                    os.unlink(self._centroids_path)
+                for key, value in (("synced", 0), ("ivf_rows", 0), ("dimensions", dimensions)):
+                    self._set_meta(key, value)
+                self._set_meta("version", self._meta("version") + 1)
+        self._db.commit()
+        if not os.path.exists(self._matrix_path):
+            open(self._matrix_path, "ab").close()
+
+    # --- Metadata ---
+
+    def _meta(self, key: str) -> int:
+        return self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _set_meta(self, key: str, value: int):
+        self._db.execute("UPDATE meta SET value = ? WHERE key = ?", (value, key))
+
+    def ready(self) -> bool:
+        """
+        True once a full sync from the database has completed, so searches are complete.
+        """
+        with self._lock:
+            return bool(self._meta("synced"))
+
+    def mark_synced(self):
+        with self._lock:
+            self._set_meta("synced", 1)
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM rows WHERE id IS NOT NULL").fetchone()[0]
+
+    def ids_between(self, kind: str, low: str, high: Optional[str]) -> List[str]:
+        """
+        Mirrored ids of `kind` in (low, high], or above `low` when high is None.
+        """
+        with self._lock:
+            if high is None:
+                cursor = self._db.execute("SELECT id FROM rows WHERE kind = ? AND id > ?", (kind, low))
+            else:
+                cursor = self._db.execute("SELECT id FROM rows WHERE kind = ? AND id > ? AND id <= ?", (kind, low, high))
+            return [r[0] for r in cursor]
+
+    def missing(self, ids: List[str]) -> List[str]:
+        with self._lock:
+            known = set()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                known.update(r[0] for r in self._db.execute(f"SELECT id FROM rows WHERE id IN ({placeholders})", batch))
+            return [i for i in ids if i not in known]
+
+    # --- Writes ---
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(f"{self.path}.lock", "a") as handle:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _assign_lists(self, vectors: np.ndarray) -> List[Optional[int]]:
+        centroids = self._load_centroids()
+        if centroids is None:
+            return [None] * len(vectors)
+        return [int(i) for i in np.argmax(vectors @ centroids.T, axis=1)]
+
+    def upsert(self, items: List[Tuple[str, str, List[float]]]):
+        """
+        Adds or replaces (id, kind, vector) rows.
+        """
+        if not items:
+            return
+        vectors = np.asarray([vector for _, _, vector in items], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with self._write_lock():
+            lists = self._assign_lists(vectors)
+            placements = []
+            free = [r[0] for r in self._db.execute("SELECT row FROM rows WHERE id IS NULL ORDER BY row")]
+            next_row = self._db.execute("SELECT coalesce(max(row) + 1, 0) FROM rows").fetchone()[0]
+            for (node_id, kind, _), ivf_list in zip(items, lists):
+                existing = self._db.execute("SELECT row FROM rows WHERE id = ?", (node_id,)).fetchone()
+                if existing is not None:
+                    row = existing[0]
+                elif free:
+                    row = free.pop(0)
+                else:
+                    row, next_row = next_row, next_row + 1
+                placements.append((row, node_id, kind, ivf_list))
+
+            # Vectors land in the file before the rows become visible to readers
+            with open(self._matrix_path, "r+b") as matrix:
+                for (row, _, _, _), vector in zip(placements, vectors):
+                    matrix.seek(row * self.dimensions * self.dtype.itemsize)
+                    matrix.write(vector.astype(self.dtype).tobytes())
+            self._db.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, kind, list) VALUES (?, ?, ?, ?)",
+                placements,
+            )
+            self._set_meta("version", self._meta("version") + 1)
+            self._db.commit()
+
+    def remove(self, ids: List[str]):
+        """
+        Tombstones rows; their slots are reused by later inserts.
+        """
+        if not ids:
+            return
+        with self._write_lock():
+            self._db.executemany(
+                "UPDATE rows SET id = NULL, kind = NULL, list = NULL WHERE id = ?",
+                [(i,) for i in ids],
+            )
+            self._set_meta("version", self._meta("version") + 1)
+            self._db.commit()
+
+    # --- IVF ---
+
+    def _load_centroids(self) -> Optional[np.ndarray]:
+        if not self.ivf_lists or not os.path.exists(self._centroids_path):
+            return None
+        try:
+            centroids = np.load(self._centroids_path)
+        except (OSError, ValueError):
+            return None
+        return centroids if len(centroids) == self.ivf_lists else None
+
+    def needs_training(self) -> bool:
+        if not self.ivf_lists:
+            return False
+        count = self.count()
+        with self._lock:
+            trained = self._meta("ivf_rows")
+        return count >= IVF_MIN_ROWS_PER_LIST * self.ivf_lists and (trained == 0 or count >= 2 * trained)
+
+    def train_ivf(self):
+        """
+        Partitions the rows into `ivf_lists` k-means lists and assigns every row.
+        """
+        from .raiven_raptor import kmeans
+        version, rows, _, _, _, matrix, _ = self._snapshot()
+        if len(rows) < self.ivf_lists:
+            return
+        rng = np.random.default_rng(0)
+        sample = rows if len(rows) <= IVF_TRAINING_SAMPLE else rng.choice(rows, IVF_TRAINING_SAMPLE, replace=False)
+        vectors = np.asarray(matrix[np.sort(sample)], dtype=np.float32)
+        labels = kmeans(vectors, self.ivf_lists)
+        centroids = np.zeros((self.ivf_lists, self.dimensions), dtype=np.float32)
+        np.add.at(centroids, labels, vectors)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+        with self._write_lock():
+            temporary = f"{self._centroids_path}.tmp.npy"
+            np.save(temporary, centroids)
+            os.replace(temporary, self._centroids_path)
+            for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+                block = rows[start:start + SEARCH_BLOCK_ROWS]
+                assigned = np.argmax(np.asarray(matrix[block], dtype=np.float32) @ centroids.T, axis=1)
+                self._db.executemany(
+                    "UPDATE rows SET list = ? WHERE row = ?",
+                    [(int(l), int(r)) for l, r in zip(assigned, block)],
+                )
+            self._set_meta("ivf_rows", len(rows))
+            self._set_meta("version", self._meta("version") + 1)
+            self._db.commit()
+        print(f">> Vector mirror: trained {self.ivf_lists} IVF lists on {len(sample)} of {len(rows)} rows", file=sys.stderr)
+
+    # --- Search ---
+
+    def _snapshot(self):
+        """
+        Reader view of the current version, rebuilt only after a write.
+        """
+        with self._lock:
+            version = self._meta("version")
+            if self._view is not None and self._view[0] == version:
+                return self._view
+            records = self._db.execute("SELECT row, id, kind, coalesce(list, -1) FROM rows WHERE id IS NOT NULL ORDER BY row").fetchall()
+            total = self._db.execute("SELECT coalesce(max(row) + 1, 0) FROM rows").fetchone()[0]
+        rows = np.asarray([r[0] for r in records], dtype=np.int64)
+        ids = np.asarray([r[1] for r in records], dtype=object)
+        kinds = np.asarray([r[2] for r in records], dtype=object)
+        lists = np.asarray([r[3] for r in records], dtype=np.int64)
+        matrix = None
+        if total:
+            matrix = np.memmap(self._matrix_path, dtype=self.dtype, mode="r", shape=(total, self.dimensions))
+        view = (version, rows, ids, kinds, lists, matrix, self._load_centroids())
+        with self._lock:
+            self._view = view
+        return view
+
+    def search(self, vector: List[float], k: int, kind: str = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (id, score) by cosine similarity, best first. Scores use the vector
+        index convention (1 + cos) / 2, so they compare with Neo4j's.
+        """
+        _, rows, ids, kinds, lists, matrix, centroids = self._snapshot()
+        if matrix is None or not len(rows) or k <= 0:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        selected = np.ones(len(rows), dtype=bool)
+        if kind is not None:
+            selected &= kinds == kind
+        if centroids is not None:
+            probes = np.argsort(-(centroids @ query))[:self.ivf_probes]
+            # Rows added since training (list -1) are always scanned
+            selected &= np.isin(lists, probes) | (lists < 0)
+        candidates = np.flatnonzero(selected)
+        if not len(candidates):
+            return []
+
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), SEARCH_BLOCK_ROWS):
+            block = rows[candidates[start:start + SEARCH_BLOCK_ROWS]]
+            scores[start:start + len(block)] = np.asarray(matrix[block], dtype=np.float32) @ query
+        k = min(k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # float16 rounding can push a self-match just past 1
+        return [(ids[candidates[i]], float((1.0 + min(scores[i], 1.0)) / 2.0)) for i in top]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": self._db.execute("SELECT count(*) FROM rows WHERE id IS NOT NULL").fetchone()[0],
+                "tombstones": self._db.execute("SELECT count(*) FROM rows WHERE id IS NULL").fetchone()[0],
+                "synced": bool(self._meta("synced")),
+                "ivf_rows": self._meta("ivf_rows"),
+                "dtype": self.dtype.name,
+            }
+
+    def close(self):
+        with self._lock:
+            self._view = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None